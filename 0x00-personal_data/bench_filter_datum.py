@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of filter_datum against the original implementation,
+which recompiled its regex on every call.
+"""
+import re
+import sys
+import timeit
+from typing import List
+
+from filtered_logger import PII_FIELDS, filter_datum
+
+
+def legacy_filter_datum(
+    fields: List[str], redaction: str, message: str, separator: str
+) -> str:
+    """filter_datum as it was before the redaction engine was cached."""
+    pattern = fr"({'|'.join(fields)})=.*?{re.escape(separator)}"
+    return re.sub(
+        pattern,
+        lambda m: f"{m.group(1)}={redaction}{separator}",
+        message
+    )
+
+
+MESSAGES = {
+    "pii": "name=Bob;email=bob@dylan.com;phone=555-1234;ssn=123-45-6789;"
+           "password=s3cr3t;ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+           "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;",
+    "no_pii": "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+              "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;",
+}
+
+
+def main() -> None:
+    """Times both implementations on messages with and without PII."""
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fields = list(PII_FIELDS)
+    for label, message in MESSAGES.items():
+        assert filter_datum(fields, "***", message, ";") == \
+            legacy_filter_datum(fields, "***", message, ";")
+        for name, func in (("legacy", legacy_filter_datum),
+                           ("cached", filter_datum)):
+            elapsed = timeit.timeit(
+                lambda: func(fields, "***", message, ";"), number=number
+            )
+            print("{:<7} {:<7} {:>10.0f} msg/s".format(
+                label, name, number / elapsed
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark of RedactingFormatter in records/s on PII-heavy and PII-free
+workloads, against the original format(), which redacted every message
+with the regex and overwrote record.msg.
+"""
+import logging
+import sys
+import time
+from typing import Callable, List
+
+from filtered_logger import PII_FIELDS, RedactingFormatter
+
+
+class LegacyRedactingFormatter(RedactingFormatter):
+    """RedactingFormatter.format as it was before structured records."""
+
+    formatTime = logging.Formatter.formatTime
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format and redact sensitive fields in log messages."""
+        record.msg = self._redact(record.getMessage())
+        return logging.Formatter.format(self, record)
+
+
+PII = "name=Bob;email=bob@dylan.com;phone=555-1234;ssn=123-45-6789;" \
+      "password=s3cr3t;ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;" \
+      "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;"
+NO_PII = "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;" \
+         "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;"
+
+# workload -> (msg, extra)
+WORKLOADS = {
+    "text pii": (PII, None),
+    "text no_pii": (NO_PII, None),
+    "dict pii": ({"email": "bob@dylan.com", "ssn": "123-45-6789",
+                  "ip": "60ed:c396:2ff:244:bbd0:9208:26f2:93ea"}, None),
+    "dict no_pii": ({"ip": "60ed:c396:2ff:244:bbd0:9208:26f2:93ea",
+                     "last_login": "2019-11-14 06:14:24"}, None),
+    "extra pii": (NO_PII, {"email": "bob@dylan.com"}),
+}
+
+
+def records(msg, extra, count: int) -> List[logging.LogRecord]:
+    """Fresh records of `msg` with the `extra` attributes."""
+    logger = logging.getLogger("user_data")
+    return [logger.makeRecord(logger.name, logging.INFO, "(unknown file)",
+                              0, msg, None, None, extra=extra)
+            for _ in range(count)]
+
+
+def rate(formatters: List[Callable], batch: List[logging.LogRecord]) -> float:
+    """Records/s of formatting each record of `batch` with every one of
+    `formatters`, like a logger with one handler per formatter."""
+    start = time.perf_counter()
+    for record in batch:
+        for formatter in formatters:
+            formatter.format(record)
+    return len(batch) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    """Times both formatters, with one and with two handlers."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for label, (msg, extra) in WORKLOADS.items():
+        for handlers in (1, 2):
+            results = [0.0, 0.0]
+            # best of 5 interleaved runs, as the host may be noisy
+            for _ in range(5):
+                for i, cls in enumerate((LegacyRedactingFormatter,
+                                         RedactingFormatter)):
+                    formatters = [cls(PII_FIELDS) for _ in range(handlers)]
+                    results[i] = max(results[i], rate(
+                        formatters, records(msg, extra, count)
+                    ))
+            print("{:<12} {} handler(s): legacy {:>9.0f}, new {:>9.0f} "
+                  "records/s ({:.2f}x)".format(
+                      label, handlers, *results, results[1] / results[0]))
+
+
+if __name__ == "__main__":
+    main()
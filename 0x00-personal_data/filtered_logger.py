@@ -5,30 +5,88 @@ Module for filtering sensitive data from log messages.
 
 import re
 import os
+import atexit
+import sys
+import json
+import time
+import queue
+import functools
+import threading
+from contextlib import contextmanager
 import mysql.connector
 from mysql.connector.connection import MySQLConnection
 import logging
-from typing import List, Tuple
+import logging.handlers
+from typing import (
+    Any, Callable, Iterator, List, Optional, Sequence, Tuple
+)
 
 
 PII_FIELDS: Tuple[str, ...] = ("name", "email", "phone", "ssn", "password")
+# attributes every LogRecord has, which `extra=` can't set
+RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None))
+) | {"message", "asctime"}
+
+
+@functools.lru_cache(maxsize=128)
+def get_markers(fields: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    """Returns the `<field>=` strings one of which a message must contain
+    to hold a value of `fields`, or None when `fields` are regex fragments
+    such as "pass.*" and every message may.
+    """
+    if not all(re.escape(field) == field for field in fields):
+        return None
+    # an empty field list degenerates to "()=", i.e. any "="
+    return tuple(f"{field}=" for field in fields) or ("=",)
+
+
+@functools.lru_cache(maxsize=128)
+def get_redactor(
+    fields: Tuple[str, ...], redaction: str, separator: str
+) -> Callable[[str], str]:
+    """Builds (once per fields/redaction/separator) a function that
+    obfuscates the values of `fields` in a message in a single pass.
+
+    Messages that contain none of the `<field>=` markers are returned
+    untouched without running the regex at all.
+    """
+    pattern = re.compile(
+        fr"({'|'.join(fields)})=.*?{re.escape(separator)}"
+    )
+    tail = f"={redaction}{separator}"
+    substitute = functools.partial(pattern.sub, lambda m: m.group(1) + tail)
+    markers = get_markers(fields)
+
+    def redact(message: str) -> str:
+        """Obfuscates the configured fields in `message`."""
+        if markers is None:
+            return substitute(message)
+        for marker in markers:
+            if marker in message:
+                return substitute(message)
+        return message
+
+    return redact
 
 
 def filter_datum(
-    fields: List[str], redaction: str, message: str, separator: str
+    fields: Sequence[str], redaction: str, message: str, separator: str
 ) -> str:
     """Obfuscates the values of specified fields in a log message.
     """
-    pattern = fr"({'|'.join(fields)})=.*?{re.escape(separator)}"
-    return re.sub(
-        pattern,
-        lambda m: f"{m.group(1)}={redaction}{separator}",
-        message
-    )
+    return get_redactor(tuple(fields), redaction, separator)(message)
 
 
 class RedactingFormatter(logging.Formatter):
-    """ Redacting Formatter class """
+    """ Redacting Formatter class
+
+    Text messages are redacted by the regex of get_redactor(), which skips
+    messages holding none of the fields; dict messages and `extra=` fields
+    printed by FORMAT are redacted by key. The message is computed once per
+    record and the msg and args of records are never modified, so the
+    other handlers of a logger still see the original record.
+    """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
@@ -38,29 +96,242 @@ class RedactingFormatter(logging.Formatter):
         """Initialize the formatter with fields to redact."""
         super().__init__(self.FORMAT)
         self.fields = fields
+        self._fields = frozenset(fields)
+        # fields an `extra=` argument may have added to a record, that
+        # the format prints
+        self._extra_fields = tuple(
+            field for field in self._fields - RECORD_ATTRIBUTES
+            if "%({})".format(field) in self._fmt
+        )
+        self._uses_time = self.usesTime()
+        # (second, its date and time) last formatted by formatTime()
+        self._second = (None, "")
+        self._redact = get_redactor(
+            tuple(fields), self.REDACTION, self.SEPARATOR
+        )
+
+    def redact_message(self, record: logging.LogRecord) -> str:
+        """Returns the message of `record` with the fields redacted."""
+        msg = record.msg
+        if isinstance(msg, dict) and not self._fields.isdisjoint(msg):
+            message = str({
+                k: self.REDACTION if k in self._fields else v
+                for k, v in msg.items()
+            })
+            return message % record.args if record.args else message
+        return self._redact(record.getMessage())
+
+    def formatTime(
+        self, record: logging.LogRecord, datefmt: Optional[str] = None
+    ) -> str:
+        """logging.Formatter.formatTime, formatting the date and time of
+        the default format once per second."""
+        if datefmt is not None or self.default_msec_format is None:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        last = self._second
+        if last[0] != second:
+            last = self._second = (second, time.strftime(
+                self.default_time_format, self.converter(record.created)
+            ))
+        return self.default_msec_format % (last[1], record.msecs)
 
     def format(self, record: logging.LogRecord) -> str:
         """Format and redact sensitive fields in log messages."""
-        original = record.getMessage()
-        redacted = filter_datum(
-            self.fields, self.REDACTION, original, self.SEPARATOR
+        message = self.redact_message(record)
+        attributes = record.__dict__
+        for field in self._extra_fields:
+            if field in attributes:
+                clean = object.__new__(record.__class__)
+                clean.__dict__.update(attributes)
+                for field in self._extra_fields:
+                    if field in attributes:
+                        setattr(clean, field, self.REDACTION)
+                record = clean
+                break
+        # logging.Formatter.format, from the message computed above
+        record.message = message
+        if self._uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + record.exc_text
+        if record.stack_info:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + self.formatStack(record.stack_info)
+        return s
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue: the caller only enqueues the record,
+    left as is for the listener to redact and format. When the queue is
+    full, `overflow` decides: "block" waits for room, "drop_new" drops the
+    record and "drop_old" the oldest queued one. Dropped records are
+    counted in `dropped`. Closing the handler, as logging does at exit,
+    stops `listener` once it wrote every queued record.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_new", "drop_old")
+
+    def __init__(
+        self, records: queue.Queue, overflow: str = "block",
+        listener: Optional["BatchingListener"] = None
+    ):
+        """Initialize the handler feeding `records`."""
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("unknown overflow policy: {}".format(overflow))
+        super().__init__(records)
+        self.overflow = overflow
+        self.listener = listener
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Enqueue the record untouched: the listener formats it."""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put `record` in the queue, applying the overflow policy."""
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == "drop_new":
+                    self.dropped += 1
+                    return
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def close(self) -> None:
+        """Stop the listener, after it wrote the queued records."""
+        if self.listener is not None:
+            self.listener.stop()
+        super().close()
+
+
+class BatchingListener:
+    """
+    Background thread writing the records of a queue through `handler`:
+    it takes every record waiting, up to `batch_size`, then formats them
+    and writes them with one write() and one flush().
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self, records: queue.Queue, handler: logging.StreamHandler,
+        batch_size: int = 256
+    ):
+        """Initialize a stopped listener."""
+        self.queue = records
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the background thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="log-listener", daemon=True
         )
-        record.msg = redacted
-        return super().format(record)
+        self._thread.start()
 
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        """Format and write a batch of records."""
+        handler = self.handler
+        lines = []
+        for record in batch:
+            if record.levelno < handler.level or not handler.filter(record):
+                continue
+            try:
+                lines.append(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        with handler.lock:
+            try:
+                handler.stream.write("".join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(batch[-1])
 
-def get_logger() -> logging.Logger:
-    """Creates and returns a configured logger for user data."""
+    def _run(self) -> None:
+        """Write batches until the stop marker is dequeued."""
+        while True:
+            batch = []
+            record = self.queue.get()
+            while record is not self._STOP:
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            if record is self._STOP:
+                return
 
+    def stop(self) -> None:
+        """Write every record queued so far and stop the thread."""
+        if self._thread is None:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+
+def get_logger(non_blocking: Optional[bool] = None) -> logging.Logger:
+    """Creates and returns a configured logger for user data.
+
+    Calling it again returns the same logger without adding handlers. The
+    non-blocking mode, also turned on by PERSONAL_DATA_LOG_ASYNC=1, only
+    queues records; a BatchingListener redacts and writes them, and every
+    queued record is written when the handler is closed, at exit. The
+    queue holds PERSONAL_DATA_LOG_QUEUE_SIZE records (10000 by default), then
+    PERSONAL_DATA_LOG_OVERFLOW applies (see BoundedQueueHandler), and
+    batches are of up to PERSONAL_DATA_LOG_BATCH_SIZE records (256).
+    """
     logger = logging.getLogger("user_data")
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
 
-    logger.addHandler(stream_handler)
+    if non_blocking is None:
+        non_blocking = os.environ.get("PERSONAL_DATA_LOG_ASYNC") == "1"
+    if not non_blocking:
+        logger.addHandler(stream_handler)
+        return logger
 
+    records = queue.Queue(
+        int(os.environ.get("PERSONAL_DATA_LOG_QUEUE_SIZE", 10000))
+    )
+    listener = BatchingListener(
+        records, stream_handler,
+        int(os.environ.get("PERSONAL_DATA_LOG_BATCH_SIZE", 256))
+    )
+    listener.start()
+    # logging.shutdown() closes it at exit before the older stream_handler
+    logger.addHandler(BoundedQueueHandler(
+        records, os.environ.get("PERSONAL_DATA_LOG_OVERFLOW", "block"),
+        listener
+    ))
     return logger
 
 
@@ -74,26 +345,310 @@ def get_db() -> MySQLConnection:
     )
 
 
-def main() -> None:
+class ConnectionPool:
     """
-    Obtain a database connection, retrieve all rows in the users table,
-    and log each row with redacted PII fields.
+    Bounded pool of connections created by `factory` (get_db by default).
+
+    Size and maximum connection lifetime (seconds) default to the
+    PERSONAL_DATA_DB_POOL_SIZE and PERSONAL_DATA_DB_POOL_MAX_LIFETIME
+    environment variables. Idle connections are health-checked on checkout
+    and recycled once older than the lifetime.
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[], Any]] = None,
+        size: Optional[int] = None,
+        max_lifetime: Optional[float] = None,
+        health_check: Optional[Callable[[Any], bool]] = None
+    ):
+        """Initialize an empty pool; connections are opened lazily."""
+        self._factory = factory or get_db
+        self.size = size or int(
+            os.environ.get("PERSONAL_DATA_DB_POOL_SIZE", 5)
+        )
+        self.max_lifetime = max_lifetime or float(
+            os.environ.get("PERSONAL_DATA_DB_POOL_MAX_LIFETIME", 3600)
+        )
+        self._health_check = health_check or self.is_healthy
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = queue.LifoQueue()
+        self._opened_at = {}
+        self._closed = False
+
+    @staticmethod
+    def is_healthy(conn: Any) -> bool:
+        """Default health check: is_connected() when the driver has it,
+        a `SELECT 1` round trip otherwise."""
+        try:
+            if hasattr(conn, "is_connected"):
+                return conn.is_connected()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _expired(self, conn: Any) -> bool:
+        """Whether `conn` has outlived max_lifetime."""
+        opened_at = self._opened_at.get(id(conn), 0)
+        return time.monotonic() - opened_at >= self.max_lifetime
+
+    def _discard(self, conn: Any) -> None:
+        """Close `conn` and forget about it."""
+        self._opened_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Check a healthy connection out of the pool, opening one if no
+        idle connection is available. Blocks while `size` are in use."""
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("no database connection available")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._factory()
+                    self._opened_at[id(conn)] = time.monotonic()
+                    return conn
+                if not self._expired(conn) and self._health_check(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        """Return `conn` to the pool, or close it when `discard` is set,
+        the pool is closed or the connection has expired."""
+        try:
+            if discard or self._closed or self._expired(conn):
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Context manager lending a connection for the `with` block;
+        a connection whose block raised is discarded, not reused."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=True)
+            raise
+        self.release(conn)
+
+    @property
+    def closed(self) -> bool:
+        """Whether close() was called."""
+        return self._closed
+
+    def close(self) -> None:
+        """Close every idle connection; checked out connections are closed
+        as they are released."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> "ConnectionPool":
+        """Use the pool itself as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the pool when leaving the `with` block."""
+        self.close()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the process wide pool of get_db() connections, closed at
+    exit; a new one replaces it once closed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ConnectionPool(get_db)
+            atexit.register(_pool.close)
+        return _pool
+
+
+def row_template(fields: Sequence[str]) -> str:
+    """Builds a str.format template rendering a row as `field=value; ...;`
+    """
+    return "; ".join(
+        "{}={{}}".format(field.replace("{", "{{").replace("}", "}}"))
+        for field in fields
+    ) + ";"
+
+
+def log_rows(
+    logger: logging.Logger, template: str, rows: Sequence[Sequence[Any]]
+) -> None:
+    """Log each row rendered by `template` at INFO level."""
+    for message in [template.format(*row) for row in rows]:
+        logger.handle(logger.makeRecord(
+            logger.name, logging.INFO, "(unknown file)", 0,
+            message, None, None
+        ))
+
+
+def export_users(
+    db: MySQLConnection, logger: logging.Logger, batch_size: int = 1000
+) -> int:
+    """
+    Stream the users table through `logger`, `batch_size` rows at a time,
+    and return the number of rows exported.
+
+    The cursor is unbuffered so rows are pulled from the server with
+    fetchmany() as they are logged; peak memory is bounded by one batch.
     """
-    db = get_db()
     cursor = db.cursor()
+    exported = 0
+    try:
+        cursor.execute("SELECT * FROM users;")
+        template = row_template([desc[0] for desc in cursor.description])
+        enabled = logger.isEnabledFor(logging.INFO)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            exported += len(rows)
+            if not enabled:
+                continue
+            log_rows(logger, template, rows)
+    finally:
+        cursor.close()
+    return exported
+
+
+def read_checkpoint(path: str) -> Optional[List[Any]]:
+    """Watermark saved at `path` by write_checkpoint(), or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)["watermark"]
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path: str, watermark: Sequence[Any]) -> None:
+    """Atomically replace the watermark saved at `path`; values JSON
+    can't hold, such as datetimes, are saved as their str()."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"watermark": list(watermark)}, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def export_users_incremental(
+    db: MySQLConnection, logger: logging.Logger, state_path: str,
+    batch_size: int = 1000, watermark: str = "last_login",
+    key: str = "email", placeholder: str = "%s"
+) -> int:
+    """
+    Log the users past the watermark saved at `state_path`, in
+    (`watermark`, `key`) order, and return the number of rows exported.
 
-    cursor.execute("SELECT * FROM users;")
-    fields = [desc[0] for desc in cursor.description]  # column names
+    Rows are read in keyset-paginated batches of `batch_size`, each one
+    selecting the rows after the last (watermark, key) pair seen, and the
+    pair is checkpointed to `state_path` after every batch: an
+    interrupted run resumes after the last batch it logged, and the next
+    run exports only the rows whose `watermark` moved past it. Rows whose
+    `watermark` is NULL are never exported. An index on
+    (`watermark`, `key`) keeps each batch a range scan. With a
+    non-blocking logger, the rows of a checkpointed batch may still be
+    queued when the process dies. `placeholder` is the query parameter
+    marker of the driver of `db`.
+    """
+    for column in (watermark, key):
+        if not re.fullmatch(r"\w+", column):
+            raise ValueError("invalid column name: {}".format(column))
+    mark = read_checkpoint(state_path)
+    order = " ORDER BY `{0}`, `{1}` LIMIT {2}".format(
+        watermark, key, placeholder
+    )
+    first = "SELECT * FROM users WHERE `{}` IS NOT NULL".format(watermark)
+    after = "SELECT * FROM users WHERE (`{0}`, `{1}`) > ({2}, {2})".format(
+        watermark, key, placeholder
+    )
+    enabled = logger.isEnabledFor(logging.INFO)
+    template = None
+    exported = 0
+    cursor = db.cursor()
+    try:
+        while True:
+            if mark is None:
+                cursor.execute(first + order, (batch_size,))
+            else:
+                cursor.execute(after + order, (*mark, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            if template is None:
+                columns = [desc[0] for desc in cursor.description]
+                template = row_template(columns)
+                positions = (columns.index(watermark), columns.index(key))
+            if enabled:
+                log_rows(logger, template, rows)
+            mark = [rows[-1][i] for i in positions]
+            write_checkpoint(state_path, mark)
+            exported += len(rows)
+            if len(rows) < batch_size:
+                break
+    finally:
+        cursor.close()
+    return exported
+
+
+def main() -> None:
+    """
+    Obtain a database connection, stream all rows in the users table,
+    and log each row with redacted PII fields.
+    With PERSONAL_DATA_EXPORT_STATE set, only the rows past the watermark
+    saved in that file are exported (see export_users_incremental), on
+    the PERSONAL_DATA_EXPORT_WATERMARK column (last_login by default)
+    with PERSONAL_DATA_EXPORT_KEY (email) breaking ties.
+    Throughput is reported on stderr once the export is done; the
+    connection goes back to the pool, closed at exit.
+    """
+    batch_size = int(os.environ.get("PERSONAL_DATA_EXPORT_BATCH_SIZE", 1000))
+    state_path = os.environ.get("PERSONAL_DATA_EXPORT_STATE")
     logger = get_logger()
 
-    for row in cursor:
-        row_data = "; ".join(
-            f"{field}={value}" for field, value in zip(fields, row)
-        ) + ";"
-        logger.info(row_data)
+    start = time.perf_counter()
+    with get_pool().connection() as db:
+        if state_path:
+            exported = export_users_incremental(
+                db, logger, state_path, batch_size,
+                os.environ.get("PERSONAL_DATA_EXPORT_WATERMARK", "last_login"),
+                os.environ.get("PERSONAL_DATA_EXPORT_KEY", "email")
+            )
+        else:
+            exported = export_users(db, logger, batch_size)
+    elapsed = time.perf_counter() - start
 
-    cursor.close()
-    db.close()
+    print("exported {} rows in {:.2f}s ({:.0f} rows/s)".format(
+        exported, elapsed, exported / elapsed if elapsed else 0
+    ), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Redact PII from existing log files or directories of log files.
+
+The input is memory-mapped and split into line-aligned chunks which a
+process pool redacts with the same engine as RedactingFormatter; results
+are written back in input order with a bounded number of chunks in flight
+across all files, so memory stays constant per worker whatever the size
+and number of the inputs.
+
+Usage: ./redact_logs.py [-w WORKERS] [-c CHUNK_MB] SOURCE DESTINATION
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Iterator, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redactor
+
+
+def chunk_bounds(path: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Yields (start, end) byte offsets of line-aligned chunks of `path`.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end >= size:
+                end = size
+            else:
+                newline = mm.find(b"\n", end - 1)
+                end = size if newline == -1 else newline + 1
+            yield start, end
+            start = end
+
+
+def redact_chunk(
+    path: str, start: int, end: int,
+    fields: Tuple[str, ...], redaction: str, separator: str
+) -> bytes:
+    """Returns the redacted bytes of `path` between `start` and `end`.
+    """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", "surrogateescape")
+    redacted = get_redactor(fields, redaction, separator)(text)
+    return redacted.encode("utf-8", "surrogateescape")
+
+
+def write_oldest(pending: deque) -> None:
+    """Writes the result of the oldest chunk of `pending` to its file,
+    closing the file after its last chunk.
+    """
+    out, future, last = pending.popleft()
+    out.write(future.result())
+    if last:
+        out.close()
+
+
+def redact_files(
+    pool: Executor, files: Iterable[Tuple[str, str]], workers: int,
+    chunk_size: int, fields: Tuple[str, ...], redaction: str, separator: str
+) -> int:
+    """Redacts each (source, destination) pair of `files` and returns the
+    bytes read. The chunks of all files share one window of 2 * `workers`
+    in flight, so the workers never wait for the end of a file.
+    """
+    total = 0
+    # [output file, future, whether it is the last chunk of the file]
+    pending = deque()
+    try:
+        for source, destination in files:
+            out = open(destination, "wb")
+            submitted = False
+            for start, end in chunk_bounds(source, chunk_size):
+                if len(pending) >= 2 * workers:
+                    write_oldest(pending)
+                pending.append([out, pool.submit(
+                    redact_chunk, source, start, end, fields, redaction,
+                    separator
+                ), False])
+                submitted = True
+            if submitted:
+                pending[-1][2] = True
+            else:
+                out.close()
+            total += os.path.getsize(source)
+        while pending:
+            write_oldest(pending)
+    finally:
+        for out in {entry[0] for entry in pending}:
+            out.close()
+    return total
+
+
+def iter_files(source: str, destination: str) -> Iterator[Tuple[str, str]]:
+    """Yields (input, output) path pairs, mirroring a source directory.
+    """
+    if not os.path.isdir(source):
+        yield source, destination
+        return
+    for root, _, files in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target, exist_ok=True)
+        for name in sorted(files):
+            yield os.path.join(root, name), os.path.join(target, name)
+
+
+def main() -> None:
+    """Parse the command line and redact the requested files."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="log file or directory to redact")
+    parser.add_argument("destination", help="output file or directory")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("-c", "--chunk-mb", type=float, default=8,
+                        help="approximate chunk size in MiB")
+    parser.add_argument("-f", "--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to redact")
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION)
+    args = parser.parse_args()
+
+    fields = tuple(f for f in args.fields.split(",") if f)
+    chunk_size = max(1, int(args.chunk_mb * 1024 * 1024))
+    workers = max(1, args.workers or 1)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        total = redact_files(pool, iter_files(args.source, args.destination),
+                             workers, chunk_size, fields, args.redaction,
+                             args.separator)
+    elapsed = time.perf_counter() - start
+
+    print("redacted {} bytes in {:.2f}s ({:.1f} MiB/s)".format(
+        total, elapsed, total / 1024 / 1024 / elapsed if elapsed else 0
+    ), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Tests of filtered_logger, with sqlite3 standing in for MySQL.
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from typing import List, Optional
+
+from filtered_logger import (
+    PII_FIELDS, ConnectionPool, RedactingFormatter, export_users,
+    export_users_incremental, get_pool, read_checkpoint
+)
+
+COLUMNS = ("name", "email", "phone", "ssn", "password", "ip", "last_login",
+           "user_agent")
+
+
+def is_closed(conn: sqlite3.Connection) -> bool:
+    """Whether `conn` has been closed."""
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def make_record(msg, *args, extra: Optional[dict] = None,
+                exc_info=None) -> logging.LogRecord:
+    """An INFO record of the user_data logger."""
+    return logging.getLogger("user_data").makeRecord(
+        "user_data", logging.INFO, "(unknown file)", 0, msg, args, exc_info,
+        extra=extra
+    )
+
+
+class TestRedactingFormatter(unittest.TestCase):
+    """RedactingFormatter."""
+
+    def setUp(self):
+        """A formatter of the PII fields."""
+        self.formatter = RedactingFormatter(list(PII_FIELDS))
+
+    def message(self, record: logging.LogRecord) -> str:
+        """Formatted `record` after the prefix of FORMAT."""
+        return self.formatter.format(record).split(": ", 1)[1]
+
+    def test_text(self):
+        """Values of the fields are redacted, others are kept."""
+        record = make_record("name=Bob;email=%s;ip=1.2.3.4;", "bob@dylan.com")
+        self.assertEqual(self.message(record),
+                         "name=***;email=***;ip=1.2.3.4;")
+        self.assertEqual(record.msg, "name=Bob;email=%s;ip=1.2.3.4;")
+        self.assertEqual(record.args, ("bob@dylan.com",))
+
+    def test_no_pii(self):
+        """Messages without fields are formatted as they are."""
+        record = make_record("ip=1.2.3.4;last_login=%s;", "today")
+        self.assertEqual(self.message(record), "ip=1.2.3.4;last_login=today;")
+
+    def test_dict(self):
+        """Dict messages are redacted by key."""
+        record = make_record({"email": "bob@dylan.com", "ip": "1.2.3.4"})
+        self.assertEqual(self.message(record),
+                         str({"email": "***", "ip": "1.2.3.4"}))
+        self.assertEqual(record.msg["email"], "bob@dylan.com")
+
+    def test_extra(self):
+        """`extra=` fields printed by the format are redacted."""
+
+        class ExtraFormatter(RedactingFormatter):
+            FORMAT = "%(email)s %(message)s"
+
+        record = make_record("ip=1.2.3.4;", extra={"email": "bob@dylan.com"})
+        self.assertEqual(ExtraFormatter(list(PII_FIELDS)).format(record),
+                         "*** ip=1.2.3.4;")
+        self.assertEqual(record.email, "bob@dylan.com")
+
+    def test_record_changed_between_handlers(self):
+        """Each format sees the record as it is, e.g. after a filter."""
+        other = RedactingFormatter(list(PII_FIELDS))
+        record = make_record("name=Bob;ip=1.2.3.4;")
+        self.assertEqual(self.message(record), "name=***;ip=1.2.3.4;")
+        record.msg = "name=b;ssn=1;"
+        self.assertIn(": name=***;ssn=***;", other.format(record))
+        record.msg = "ip=5.6.7.8;"
+        self.assertIn(": ip=5.6.7.8;", self.formatter.format(record))
+
+    def test_time(self):
+        """asctime is the one logging.Formatter formats."""
+        plain = logging.Formatter(RedactingFormatter.FORMAT)
+        for created in (1573712064.25, 1573712064.75, 1573712065.0):
+            record = make_record("ip=1.2.3.4;")
+            record.created = created
+            record.msecs = created % 1 * 1000
+            self.assertEqual(self.formatter.format(record),
+                             plain.format(record))
+
+    def test_exception(self):
+        """Tracebacks follow the message."""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record("name=Bob;", exc_info=sys.exc_info())
+        text = self.formatter.format(record)
+        self.assertIn(": name=***;\nTraceback", text)
+        self.assertTrue(text.endswith("ValueError: boom"))
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ConnectionPool over in-memory sqlite3 connections."""
+
+    def pool(self, **kwargs) -> ConnectionPool:
+        """A pool of sqlite3 connections, closed after the test."""
+        pool = ConnectionPool(lambda: sqlite3.connect(":memory:"), **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuses_idle_connection(self):
+        """A released connection is lent again."""
+        pool = self.pool(size=2)
+        with pool.connection() as conn:
+            pass
+        with pool.connection() as again:
+            self.assertIs(again, conn)
+
+    def test_health_check_on_checkout(self):
+        """An idle connection failing the health check is replaced."""
+        pool = self.pool(size=2)
+        with pool.connection() as conn:
+            pass
+        conn.close()
+        self.assertFalse(ConnectionPool.is_healthy(conn))
+        with pool.connection() as again:
+            self.assertIsNot(again, conn)
+            self.assertTrue(ConnectionPool.is_healthy(again))
+
+    def test_custom_health_check(self):
+        """The health check given to the pool decides on checkout."""
+        pool = self.pool(size=2, health_check=lambda conn: False)
+        with pool.connection() as conn:
+            pass
+        with pool.connection() as again:
+            self.assertIsNot(again, conn)
+        self.assertTrue(is_closed(conn))
+
+    def test_lifetime_expiry(self):
+        """Connections older than max_lifetime are closed, not reused."""
+        pool = self.pool(size=2, max_lifetime=0.05)
+        with pool.connection() as idle:
+            pass
+        time.sleep(0.1)
+        with pool.connection() as conn:
+            self.assertIsNot(conn, idle)
+            self.assertTrue(is_closed(idle))
+            time.sleep(0.1)
+        self.assertTrue(is_closed(conn))
+
+    def test_discard_on_exception(self):
+        """A connection whose block raised is closed, not reused."""
+        pool = self.pool(size=1)
+        with self.assertRaises(ValueError):
+            with pool.connection() as conn:
+                raise ValueError
+        self.assertTrue(is_closed(conn))
+        with pool.connection(timeout=0.1) as again:
+            self.assertIsNot(again, conn)
+
+    def test_acquire_timeout(self):
+        """acquire() raises TimeoutError while every slot is in use."""
+        pool = self.pool(size=1)
+        conn = pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire(timeout=0.05)
+        pool.release(conn)
+        self.assertIs(pool.acquire(timeout=0.05), conn)
+
+    def test_close(self):
+        """close() closes idle connections, then those released later."""
+        pool = self.pool(size=2)
+        idle = pool.acquire()
+        busy = pool.acquire()
+        pool.release(idle)
+        with pool:
+            pass
+        self.assertTrue(is_closed(idle))
+        self.assertFalse(is_closed(busy))
+        pool.release(busy)
+        self.assertTrue(is_closed(busy))
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+
+    def test_get_pool(self):
+        """get_pool() shares one pool until it is closed."""
+        pool = get_pool()
+        self.assertIs(get_pool(), pool)
+        pool.close()
+        self.assertTrue(pool.closed)
+        again = get_pool()
+        self.assertIsNot(again, pool)
+        self.assertFalse(again.closed)
+
+
+class Crash(Exception):
+    """Raised by ListHandler to interrupt an export."""
+
+
+class ListHandler(logging.Handler):
+    """Keeps the formatted records, raising Crash instead of emitting the
+    record number `crash_at` (counting from 1) if set."""
+
+    def __init__(self, crash_at: Optional[int] = None):
+        """Initialize an empty handler."""
+        super().__init__()
+        self.crash_at = crash_at
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Keep the formatted `record`."""
+        if len(self.messages) + 1 == self.crash_at:
+            raise Crash
+        self.messages.append(self.format(record))
+
+
+def user_row(i: int, last_login: Optional[str]) -> tuple:
+    """Row of the users table for user number `i`."""
+    return ("user{}".format(i), "user{:03}@example.com".format(i),
+            "555-{:04}".format(i), "123-45-{:04}".format(i), "pwd{}".format(i),
+            "10.0.0.{}".format(i % 256), last_login, "Mozilla/5.0")
+
+
+def message(row: tuple) -> str:
+    """Message logged for `row`."""
+    return "; ".join("{}={}".format(*pair) for pair in zip(COLUMNS, row)) + ";"
+
+
+class TestExport(unittest.TestCase):
+    """export_users and export_users_incremental over a sqlite3 users
+    table injected in place of the MySQL connection."""
+
+    def setUp(self):
+        """An in-memory users table, a logger and a state file path."""
+        self.db = sqlite3.connect(":memory:")
+        self.addCleanup(self.db.close)
+        self.db.execute("CREATE TABLE users ({})".format(
+            ", ".join(COLUMNS)))
+        # two users share each last_login, so batches split ties
+        self.rows = [user_row(i, "2019-11-14 06:{:02}:00".format(i // 2))
+                     for i in range(10)]
+        self.insert(self.rows + [user_row(99, None)])
+        self.logger = logging.Logger("user_data")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state = os.path.join(directory.name, "export.json")
+
+    def insert(self, rows: List[tuple]) -> None:
+        """Add `rows` to the users table, in reverse order."""
+        self.db.executemany("INSERT INTO users VALUES ({})".format(
+            ", ".join("?" * len(COLUMNS))), reversed(rows))
+        self.db.commit()
+
+    def export(self, handler: ListHandler, batch_size: int = 3) -> int:
+        """Run the incremental export through `handler` only."""
+        self.logger.handlers = [handler]
+        return export_users_incremental(self.db, self.logger, self.state,
+                                        batch_size, placeholder="?")
+
+    def test_export_users(self):
+        """Every row is logged with its PII redacted."""
+        handler = ListHandler()
+        handler.setFormatter(RedactingFormatter(list(PII_FIELDS)))
+        self.logger.addHandler(handler)
+        self.assertEqual(export_users(self.db, self.logger, 4), 11)
+        self.assertEqual(len(handler.messages), 11)
+        for text in handler.messages:
+            for field in PII_FIELDS:
+                self.assertIn(" {}=***;".format(field), text)
+            self.assertNotIn("@example.com", text)
+
+    def test_full_run(self):
+        """A first run logs every row with a watermark, in order, and
+        saves the last one."""
+        handler = ListHandler()
+        self.assertEqual(self.export(handler), 10)
+        self.assertEqual(handler.messages, [message(r) for r in self.rows])
+        last = self.rows[-1]
+        self.assertEqual(read_checkpoint(self.state), [last[6], last[1]])
+
+    def test_incremental_run(self):
+        """A later run logs only the rows past the saved watermark."""
+        self.export(ListHandler())
+        new = [user_row(i, "2019-11-15 00:00:00") for i in range(10, 15)]
+        self.insert(new)
+        handler = ListHandler()
+        self.assertEqual(self.export(handler), 5)
+        self.assertEqual(handler.messages, [message(r) for r in new])
+        self.assertEqual(self.export(ListHandler()), 0)
+
+    def test_resume_after_interrupted_batch(self):
+        """A run interrupted in a batch resumes after the last batch it
+        completed."""
+        with self.assertRaises(Crash):
+            self.export(ListHandler(crash_at=5))
+        mark = self.rows[2]
+        self.assertEqual(read_checkpoint(self.state), [mark[6], mark[1]])
+        handler = ListHandler()
+        self.assertEqual(self.export(handler), 7)
+        self.assertEqual(handler.messages,
+                         [message(r) for r in self.rows[3:]])
+
+    def test_invalid_column(self):
+        """Column names are checked before they are put in the query."""
+        with self.assertRaises(ValueError):
+            export_users_incremental(self.db, self.logger, self.state,
+                                     watermark="last_login; DROP")
+
+
+if __name__ == "__main__":
+    unittest.main()
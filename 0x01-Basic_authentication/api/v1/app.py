@@ -3,6 +3,8 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.auth.path_matcher import PathMatcher
+from api.v1.metrics import METRICS
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
@@ -13,6 +15,13 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 auth = None
+# paths served without authentication, '*' matches any characters
+EXCLUDED_PATHS = PathMatcher([
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/metrics/'
+])
 AUTH_TYPE = getenv("AUTH_TYPE")
 
 if AUTH_TYPE == "auth":
@@ -44,6 +53,13 @@ def forbidden(error) -> str:
     return jsonify({"error": "Forbidden"}), 403
 
 
+@app.errorhandler(503)
+def unavailable(error) -> str:
+    """Service unavailable handler
+    """
+    return jsonify({"error": "Too many requests, retry later"}), 503
+
+
 @app.before_request
 def handle_request_auth() -> None:
     """
@@ -53,16 +69,19 @@ def handle_request_auth() -> None:
     if auth is None:
         return
 
-    excluded_paths = [
-        '/api/v1/status/',
-        '/api/v1/unauthorized/',
-        '/api/v1/forbidden/'
-    ]
-
-    if auth.require_auth(request.path, excluded_paths):
+    timer = METRICS.timer("request_auth")
+    required = auth.require_auth(request.path, EXCLUDED_PATHS)
+    timer.lap("require_auth")
+    if required:
         if auth.authorization_header(request) is None:
             abort(401)
-        if auth.current_user(request) is None:
+        try:
+            user = auth.current_user(request)
+        except TimeoutError:
+            # the password couldn't be checked: neither 403 nor a failure
+            abort(503)
+        timer.lap("current_user")
+        if user is None:
             abort(403)
 
 
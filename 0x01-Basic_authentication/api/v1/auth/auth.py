@@ -3,7 +3,18 @@
 Module for authentication
 """
 from flask import request
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Tuple, TypeVar, Union
+
+from api.v1.auth.path_matcher import PathMatcher
+
+
+@lru_cache(maxsize=32)
+def path_matcher(excluded_paths: Tuple[str, ...]) -> PathMatcher:
+    """
+    Returns the PathMatcher of a list of excluded paths, compiled once.
+    """
+    return PathMatcher(excluded_paths)
 
 
 class Auth:
@@ -11,13 +22,15 @@ class Auth:
     Auth class to manage the API authentication.
     """
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
         """
         Checks if a path requires authentication.
         Args:
             path (str): The path to check.
-            excluded_paths (List[str]): List of paths that do not require
-                                       authentication.
+            excluded_paths (List[str] | PathMatcher): Paths that do not
+                                       require authentication, ideally
+                                       compiled once in a PathMatcher.
         Returns:
             bool: True if authentication is required, False otherwise.
         """
@@ -27,25 +40,9 @@ class Auth:
         if excluded_paths is None or not excluded_paths:
             return True
 
-        # Normalize the incoming path to always end with '/'
-        # except for the root path '/' itself
-        normalized_path = path
-        if not normalized_path.endswith('/'):
-            normalized_path += '/'
-
-        # Normalize excluded_paths to always end with '/'
-        normalized_excluded_paths = [
-            p if p.endswith('/') else p + '/'
-            for p in excluded_paths
-        ]
-
-        for excluded_path_normalized in normalized_excluded_paths:
-            if normalized_path == excluded_path_normalized:
-                return False
-            if normalized_path.startswith(excluded_path_normalized):
-                return False
-
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = path_matcher(tuple(excluded_paths))
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """
@@ -4,6 +4,9 @@ Basic Authentication module
 """
 import base64
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
+from api.v1.auth.login_throttle import LoginThrottle
+from api.v1.metrics import METRICS
 from typing import Optional, Tuple, TypeVar
 
 from models.user import User
@@ -14,6 +17,12 @@ class BasicAuth(Auth):
     BasicAuth class that inherits from Auth.
     """
 
+    # shared by every instance so Base observers are registered only once
+    credential_cache = CredentialCache.from_env()
+    login_throttle = LoginThrottle.from_env()
+    METRICS.register("credential_cache", credential_cache.stats)
+    METRICS.register("login_throttle", login_throttle.stats)
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str
                                             ) -> Optional[str]:
@@ -111,6 +120,9 @@ class BasicAuth(Auth):
 
         Returns:
             TypeVar('User'): The User object if credentials valid, else None.
+
+        Raises:
+            TimeoutError: The password can't be checked for now.
         """
         if user_email is None or not isinstance(user_email, str):
             return None
@@ -118,6 +130,7 @@ class BasicAuth(Auth):
         if user_pwd is None or not isinstance(user_pwd, str):
             return None
 
+        timer = METRICS.timer("basic_auth")
         # Search for users by email. User.search() is expected to return
         # a list of User objects (or an empty list).
         try:
@@ -125,6 +138,7 @@ class BasicAuth(Auth):
         except Exception:
             # Handle potential errors if User.
             return None
+        timer.lap("search")
 
         # If no users found with that email
         if not users:
@@ -134,7 +148,17 @@ class BasicAuth(Auth):
         user = users[0]
 
         # Check if the provided password is valid for the found user
-        if user.is_valid_password(user_pwd):
+        valid = user.is_valid_password(user_pwd)
+        timer.lap("verify_password")
+        if valid:
+            # Legacy hashes are upgraded now that the password is known,
+            # or at a later login if the pool is busy
+            if user.password_needs_rehash():
+                try:
+                    user.password = user_pwd
+                except TimeoutError:
+                    return user
+                user.save()
             return user
         else:
             return None
@@ -143,12 +167,29 @@ class BasicAuth(Auth):
         """
         Retrieves the User instance for a request by processing
         Basic Authentication header.
+        Raises TimeoutError when the password can't be checked for now.
         """
+        # Each stage is timed when API_METRICS is set
+        timer = METRICS.timer("basic_auth")
+
         # 1. Get the full Authorization header (from Auth class)
         authorization_h = self.authorization_header(request)
+        timer.lap("header")
         if authorization_h is None:
             return None
 
+        # Headers verified recently skip decoding, lookup and hashing
+        user = self.credential_cache.get(authorization_h)
+        timer.lap("cache")
+        if user is not None:
+            return user
+
+        # Headers that just failed are rejected before decoding
+        throttle = self.login_throttle
+        digest = throttle.digest(authorization_h)
+        if throttle.recently_failed(digest):
+            return None
+
         # 2. Extract the Base64 part
         base64_h = self.extract_base64_authorization_header(authorization_h)
         if base64_h is None:
@@ -161,10 +202,25 @@ class BasicAuth(Auth):
 
         # 4. Extract user credentials (email, password)
         user_email, user_pwd = self.extract_user_credentials(decoded_h)
+        timer.lap("decode")
         if user_email is None or user_pwd is None:
             return None
 
-        # 5. Get the User object from credentials
-        user = self.user_object_from_credentials(user_email, user_pwd)
+        # 5. Get the User object from credentials, unless too many
+        # attempts failed for this email or client address
+        address = getattr(request, "remote_addr", None)
+        if not throttle.acquire(user_email, address):
+            return None
+        try:
+            user = self.user_object_from_credentials(user_email, user_pwd)
+        except TimeoutError:
+            # not verified, neither a failure: the caller answers 503
+            throttle.release(user_email, address)
+            raise
+        if user is not None:
+            throttle.succeeded(user_email, address)
+            self.credential_cache.put(authorization_h, user)
+        else:
+            throttle.failed(digest, user_email)
 
         return user
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cache of verified Basic Authorization headers
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, TypeVar
+
+from models import base
+from models.user import User
+
+
+class CredentialCache:
+    """
+    Bounded LRU + TTL cache mapping a keyed digest of an Authorization
+    header to the id of the user it was verified for.
+
+    Headers are never stored: entries are keyed by an HMAC with a per
+    process random key. An entry is dropped as soon as its user is removed
+    or saved with a different password.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        """
+        Args:
+            max_size (int): Maximum number of entries, 0 disables the cache.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = max_size > 0
+        self.hits = 0
+        self.misses = 0
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+        # digest -> (user id, password hash, expiry)
+        self._entries = OrderedDict()
+        self._by_user = {}
+        base.OBSERVERS.append(self._on_change)
+
+    @classmethod
+    def from_env(cls) -> 'CredentialCache':
+        """
+        Builds a cache sized by BASIC_AUTH_CACHE_SIZE (0 disables it)
+        with entries living BASIC_AUTH_CACHE_TTL seconds.
+        """
+        return cls(int(os.getenv("BASIC_AUTH_CACHE_SIZE", "1024")),
+                   float(os.getenv("BASIC_AUTH_CACHE_TTL", "300")))
+
+    def _digest(self, authorization_header: str) -> bytes:
+        """Keyed digest of an Authorization header."""
+        return hmac.new(self._key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def _drop(self, digest: bytes) -> None:
+        """Remove one entry; the caller holds the lock."""
+        user_id = self._entries.pop(digest)[0]
+        digests = self._by_user.get(user_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[user_id]
+
+    def get(self, authorization_header: str) -> Optional[TypeVar('User')]:
+        """
+        Returns the user a header was verified for, or None on a miss.
+        A hit is only served while the user still exists with the password
+        hash seen at verification time.
+        """
+        if not self.enabled:
+            return None
+        digest = self._digest(authorization_header)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                user = User.get(entry[0])
+                if entry[2] > time.monotonic() and user is not None \
+                        and user.password == entry[1]:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return user
+                self._drop(digest)
+            self.misses += 1
+        return None
+
+    def put(self, authorization_header: str, user: TypeVar('User')) -> None:
+        """Remember that `authorization_header` authenticates `user`."""
+        if not self.enabled or user is None or user.id is None:
+            return
+        digest = self._digest(authorization_header)
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (user.id, user.password,
+                                     time.monotonic() + self.ttl)
+            self._by_user.setdefault(user.id, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Forget every header verified for `user_id`."""
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                self._drop(digest)
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> dict:
+        """Counters of the cache."""
+        return {"enabled": self.enabled, "size": len(self._entries),
+                "hits": self.hits, "misses": self.misses}
+
+    def _on_change(self, obj, event: str) -> None:
+        """Base observer invalidating entries of removed users and of
+        users saved with a new password."""
+        if not isinstance(obj, User) or obj.id not in self._by_user:
+            return
+        if event == "remove":
+            self.invalidate_user(obj.id)
+            return
+        with self._lock:
+            for digest in list(self._by_user.get(obj.id, ())):
+                if self._entries[digest][1] != obj.password:
+                    self._drop(digest)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Throttle of failed Basic logins
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from models import base
+from models.user import User
+
+
+class TokenBuckets:
+    """
+    Token buckets by key, at most `max_keys` of them: each holds up to
+    `burst` tokens and refills at `rate` tokens per second. The least
+    recently used bucket is dropped first; not being there is the same as
+    being full. It has no lock: LoginThrottle serializes the calls.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (float): Capacity of a bucket.
+            max_keys (int): Maximum number of buckets kept.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, time of the last refill]
+        self._buckets = OrderedDict()
+
+    def __len__(self) -> int:
+        """Number of buckets kept."""
+        return len(self._buckets)
+
+    def _bucket(self, key: str, now: float) -> list:
+        """Bucket of `key`, refilled up to `now`."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst,
+                            bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def has_token(self, key: str, now: float) -> bool:
+        """Whether the bucket of `key` holds a whole token."""
+        return self._bucket(key, now)[0] >= 1
+
+    def take(self, key: str, now: float) -> None:
+        """Take one token from the bucket of `key`."""
+        self._bucket(key, now)[0] -= 1
+
+    def give_back(self, key: str) -> None:
+        """Return the token taken from the bucket of `key`."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + 1)
+
+
+class LoginThrottle:
+    """
+    Rejects logins before any lookup or hashing once too many failed:
+
+    - each attempt takes a token from the bucket of its email and from
+      the bucket of its client address, and gives them back if it
+      succeeds or the password could not be checked; an attempt finding
+      an empty bucket is rejected;
+    - the keyed digest of a header that just failed is remembered for
+      `negative_ttl` seconds, and the same header is rejected at once.
+      Entries of a user are dropped when it is saved or removed.
+
+    Memory is bounded by `max_keys` buckets of each kind and
+    `negative_size` digests.
+    """
+
+    def __init__(self, email_rate: float = 0.1, email_burst: float = 10,
+                 address_rate: float = 1.0, address_burst: float = 100,
+                 max_keys: int = 10000, negative_ttl: float = 30.0,
+                 negative_size: int = 4096):
+        """
+        Args:
+            email_rate (float): Attempts per second allowed by email.
+            email_burst (float): Attempts allowed at once by email.
+            address_rate (float): Attempts per second allowed by address.
+            address_burst (float): Attempts allowed at once by address.
+            max_keys (int): Buckets kept of each kind, 0 disables the
+                throttle.
+            negative_ttl (float): Seconds a failed header is rejected.
+            negative_size (int): Maximum number of failed headers kept.
+        """
+        self.enabled = max_keys > 0
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self.allowed = 0
+        self.failures = 0
+        self.throttled_email = 0
+        self.throttled_address = 0
+        self.negative_hits = 0
+        self._emails = TokenBuckets(email_rate, email_burst, max_keys)
+        self._addresses = TokenBuckets(address_rate, address_burst,
+                                       max_keys)
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+        # digest -> (expiry, email)
+        self._negative = OrderedDict()
+        self._by_email = {}
+        base.OBSERVERS.append(self._on_change)
+
+    @classmethod
+    def from_env(cls) -> 'LoginThrottle':
+        """
+        Builds a throttle configured by LOGIN_THROTTLE_EMAIL_RATE,
+        LOGIN_THROTTLE_EMAIL_BURST, LOGIN_THROTTLE_ADDRESS_RATE,
+        LOGIN_THROTTLE_ADDRESS_BURST, LOGIN_THROTTLE_MAX_KEYS (0 disables
+        it), LOGIN_THROTTLE_NEGATIVE_TTL and LOGIN_THROTTLE_NEGATIVE_SIZE.
+        """
+        def env(name: str, default: str) -> float:
+            return float(os.getenv("LOGIN_THROTTLE_" + name, default))
+
+        return cls(env("EMAIL_RATE", "0.1"), env("EMAIL_BURST", "10"),
+                   env("ADDRESS_RATE", "1"), env("ADDRESS_BURST", "100"),
+                   int(env("MAX_KEYS", "10000")),
+                   env("NEGATIVE_TTL", "30"),
+                   int(env("NEGATIVE_SIZE", "4096")))
+
+    def digest(self, authorization_header: str) -> Optional[bytes]:
+        """Keyed digest of an Authorization header, None if disabled."""
+        if not self.enabled:
+            return None
+        return hmac.new(self._key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def _drop(self, digest: bytes) -> None:
+        """Remove one failed header; the caller holds the lock."""
+        email = self._negative.pop(digest)[1]
+        digests = self._by_email.get(email)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_email[email]
+
+    def recently_failed(self, digest: Optional[bytes]) -> bool:
+        """Whether the header of `digest` failed less than negative_ttl
+        seconds ago."""
+        if digest is None:
+            return False
+        with self._lock:
+            entry = self._negative.get(digest)
+            if entry is None:
+                return False
+            if entry[0] > time.monotonic():
+                self.negative_hits += 1
+                return True
+            self._drop(digest)
+        return False
+
+    def acquire(self, email: str, address: Optional[str]) -> bool:
+        """
+        Takes a token for a login attempt of `email` from `address`.
+        Returns False, taking nothing, when one of the buckets is empty.
+        """
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if not self._emails.has_token(email, now):
+                self.throttled_email += 1
+                return False
+            if address is not None:
+                if not self._addresses.has_token(address, now):
+                    self.throttled_address += 1
+                    return False
+                self._addresses.take(address, now)
+            self._emails.take(email, now)
+            self.allowed += 1
+        return True
+
+    def succeeded(self, email: str, address: Optional[str]) -> None:
+        """Gives back the tokens of an attempt that succeeded."""
+        self.release(email, address)
+
+    def release(self, email: str, address: Optional[str]) -> None:
+        """Gives back the tokens of an attempt that succeeded or could
+        not be verified."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._emails.give_back(email)
+            if address is not None:
+                self._addresses.give_back(address)
+
+    def failed(self, digest: Optional[bytes], email: str) -> None:
+        """Remembers that the header of `digest`, for `email`, failed."""
+        if digest is None:
+            return
+        with self._lock:
+            self.failures += 1
+            if digest in self._negative:
+                self._drop(digest)
+            self._negative[digest] = (time.monotonic() + self.negative_ttl,
+                                      email)
+            self._by_email.setdefault(email, set()).add(digest)
+            while len(self._negative) > self.negative_size:
+                self._drop(next(iter(self._negative)))
+
+    def clear(self) -> None:
+        """Forget every bucket and failed header."""
+        with self._lock:
+            self._emails = TokenBuckets(self._emails.rate,
+                                        self._emails.burst,
+                                        self._emails.max_keys)
+            self._addresses = TokenBuckets(self._addresses.rate,
+                                           self._addresses.burst,
+                                           self._addresses.max_keys)
+            self._negative.clear()
+            self._by_email.clear()
+
+    def stats(self) -> dict:
+        """Counters of the throttle."""
+        return {"enabled": self.enabled, "allowed": self.allowed,
+                "failures": self.failures,
+                "throttled_email": self.throttled_email,
+                "throttled_address": self.throttled_address,
+                "negative_hits": self.negative_hits,
+                "emails": len(self._emails),
+                "addresses": len(self._addresses),
+                "negative_size": len(self._negative)}
+
+    def _on_change(self, obj, event: str) -> None:
+        """Base observer forgetting the failed headers of a user saved,
+        maybe with a new password, or removed."""
+        if not isinstance(obj, User) or obj.email not in self._by_email:
+            return
+        with self._lock:
+            for digest in list(self._by_email.get(obj.email, ())):
+                self._drop(digest)
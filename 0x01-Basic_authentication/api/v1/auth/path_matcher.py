@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Matcher of the paths excluded from authentication
+"""
+from typing import Iterable
+
+
+class PathMatcher:
+    """
+    Character trie of path patterns, answering whether a path is excluded
+    in one pass over the path. Without wildcards a single trie node is
+    walked, whatever the number of patterns; each '*' adds nodes to the set
+    walked, so the time is bounded by the length of the path times the
+    number of nodes.
+
+    Patterns are normalized like Auth.require_auth always did: a pattern
+    matches its own path and every path below it, with or without a
+    trailing '/'. A '*' matches any run of characters, so '/api/v1/stat*'
+    matches '/api/v1/status' and '/api/v1/stats'.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        """
+        Args:
+            patterns (Iterable[str]): Paths or wildcard patterns to match.
+        """
+        self.patterns = []
+        self._root = {}
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str) -> None:
+        """Add one pattern to the trie."""
+        if not pattern.endswith('/') and not pattern.endswith('*'):
+            pattern += '/'
+        node = self._root
+        for char in pattern:
+            node = node.setdefault(char, {})
+        # None marks the end of a pattern: whatever follows matches
+        node[None] = True
+        self.patterns.append(pattern)
+
+    def __len__(self) -> int:
+        """Number of patterns."""
+        return len(self.patterns)
+
+    def match(self, path: str) -> bool:
+        """
+        Checks if a path is matched by one of the patterns.
+        Args:
+            path (str): The path to check.
+        Returns:
+            bool: True if a pattern matches the path, False otherwise.
+        """
+        if not path.endswith('/'):
+            path += '/'
+        node = self._root
+        i = 0
+        # a single node to follow until a '*' branches off
+        while '*' not in node:
+            if None in node:
+                return True
+            if i == len(path):
+                return False
+            node = node.get(path[i])
+            if node is None:
+                return False
+            i += 1
+        # node id -> (node, whether it is past a '*', which matches any
+        # character and stays in the set)
+        nodes = {}
+        self._enter(node, False, nodes)
+        for char in path[i:]:
+            following = {}
+            for node, star in nodes.values():
+                if None in node:
+                    return True
+                if star:
+                    following[id(node)] = (node, True)
+                child = node.get(char)
+                if child is not None:
+                    self._enter(child, char == '*', following)
+            nodes = following
+        return any(None in node for node, _ in nodes.values())
+
+    @staticmethod
+    def _enter(node: dict, star: bool, nodes: dict) -> None:
+        """Add `node` to `nodes` with the nodes after its '*' children,
+        since a '*' also matches no character."""
+        while id(node) not in nodes:
+            nodes[id(node)] = (node, star)
+            node = node.get('*')
+            if node is None:
+                return
+            star = True
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+In-process latency histograms of the request pipeline, enabled with
+API_METRICS=1 and served by GET /api/v1/metrics
+"""
+import math
+import threading
+from os import getenv
+from threading import get_ident
+from time import perf_counter_ns
+from typing import Callable, Dict
+
+
+class Histogram:
+    """
+    Log-linear histogram of durations in nanoseconds: exact below 16 ns,
+    then 8 buckets per power of two, so quantiles are within 6.25%.
+    It has no lock: one thread at a time records in it.
+    """
+
+    SUB_BUCKETS = 8
+    MAX_INDEX = 16 + 40 * SUB_BUCKETS
+
+    def __init__(self):
+        """Initialize an empty histogram."""
+        self.counts = [0] * (self.MAX_INDEX + 1)
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        """Bucket of a duration."""
+        if value < 16:
+            return value if value > 0 else 0
+        shift = value.bit_length() - 4
+        index = 8 + (shift - 1) * cls.SUB_BUCKETS + (value >> shift)
+        return index if index < cls.MAX_INDEX else cls.MAX_INDEX
+
+    @classmethod
+    def _value(cls, index: int) -> float:
+        """Middle of a bucket."""
+        if index < 16:
+            return float(index)
+        shift = (index - 16) // cls.SUB_BUCKETS + 1
+        top = (index - 16) % cls.SUB_BUCKETS + 8
+        return (top + 0.5) * (1 << shift)
+
+    def record(self, value: int) -> None:
+        """Count one duration."""
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram') -> None:
+        """Add the durations counted by `other`."""
+        for index, count in enumerate(list(other.counts)):
+            self.counts[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Approximate duration below which a fraction `q` falls."""
+        counts = self.counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = max(math.ceil(q * total), 1)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self._value(index)
+        return float(self.max)
+
+    def summary(self) -> dict:
+        """Count and p50/p95/p99/max in microseconds."""
+        summary = {"count": sum(self.counts)}
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            summary[name + "_us"] = round(self.quantile(q) / 1000, 3)
+        summary["max_us"] = round(self.max / 1000, 3)
+        return summary
+
+
+class Timer:
+    """
+    Measures the consecutive stages of one operation: each lap() records
+    the time since the previous one under "<prefix>.<stage>".
+    """
+
+    __slots__ = ('_metrics', '_prefix', '_last')
+
+    def __init__(self, metrics: 'Metrics', prefix: str):
+        """Start timing."""
+        self._metrics = metrics
+        self._prefix = prefix + "."
+        self._last = perf_counter_ns()
+
+    def lap(self, stage: str) -> None:
+        """Record the stage that just ended."""
+        now = perf_counter_ns()
+        self._metrics.record(self._prefix + stage, now - self._last)
+        self._last = now
+
+
+class NullTimer:
+    """Timer handed out while metrics are disabled."""
+
+    __slots__ = ()
+
+    def lap(self, stage: str) -> None:
+        """Do nothing."""
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    Registry of the histograms of each stage, by name, and of the
+    callables returning the counters of each component.
+
+    Each thread records in its own shard of histograms, so recording
+    takes no lock; shards are keyed by thread id, which the threads of a
+    server reuse, and merged by snapshot().
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        Args:
+            enabled (bool): Whether timers measure anything.
+        """
+        self.enabled = enabled
+        # thread id -> stage name -> Histogram
+        self._shards: Dict[int, Dict[str, Histogram]] = {}
+        self._counters: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def timer(self, prefix: str):
+        """Returns a Timer, or a no-op one while disabled."""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, prefix)
+
+    def record(self, name: str, value: int) -> None:
+        """Count one duration in nanoseconds under `name`."""
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(get_ident(), {})
+        histogram = shard.get(name)
+        if histogram is None:
+            histogram = shard[name] = Histogram()
+        histogram.record(value)
+
+    def register(self, name: str, counters: Callable[[], dict]) -> None:
+        """Serve counters() under `name`, whether enabled or not."""
+        self._counters[name] = counters
+
+    def snapshot(self) -> dict:
+        """Summary of every stage, merged across threads, and the
+        counters of every component."""
+        with self._lock:
+            shards = list(self._shards.values())
+        merged = {}
+        for shard in shards:
+            for name, histogram in list(shard.items()):
+                merged.setdefault(name, Histogram()).merge(histogram)
+        return {"enabled": self.enabled,
+                "stages": {name: merged[name].summary()
+                           for name in sorted(merged)},
+                "counters": {name: counters()
+                             for name, counters in self._counters.items()}}
+
+
+METRICS = Metrics(getenv("API_METRICS", "0") == "1")
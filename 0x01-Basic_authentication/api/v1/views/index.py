@@ -26,6 +26,17 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - count and p50/p95/p99/max latency in microseconds of each stage
+        of the authentication pipeline, timed when API_METRICS=1
+    """
+    from api.v1.metrics import METRICS
+    return jsonify(METRICS.snapshot())
+
+
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorized() -> str:
     """GET /api/v1/unauthorized
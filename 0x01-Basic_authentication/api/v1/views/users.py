@@ -1,19 +1,125 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import base64
+import binascii
+import json
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, make_response, request
+from models.password import hash_passwords
 from models.user import User
 
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 10000
+# bytes read at most from the body of a batch, 1 KiB per user on average
+MAX_BATCH_BYTES = MAX_BATCH_SIZE * 1024
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def encode_cursor(user_id: str) -> str:
+    """ Opaque cursor pointing after `user_id`
+    """
+    return base64.urlsafe_b64encode(user_id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """ User ID of a cursor, None if invalid
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return base64.b64decode(padded.encode(), altchars=b"-_",
+                                validate=True).decode()
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def user_etag(user: User) -> str:
+    """ ETag of a user: the digest of its JSON form, which stays exact for
+    objects reloaded from storage with timestamps cut to the second
+    """
+    return "{}-{}".format(user.id, user.digest())
+
+
+def not_modified(etag: str) -> Response:
+    """ 304 response when the client already has the representation
+    tagged `etag` (If-None-Match), None otherwise
+    """
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def stream_users(after: str = None):
+    """ Generate the JSON array of users after the ID `after`, one page
+    at a time so memory doesn't grow with the number of users
+    """
+    yield "["
+    separator = ""
+    while True:
+        users = User.page(STREAM_PAGE_SIZE, after)
+        if not users:
+            break
+        chunk = ",".join(json.dumps(user.to_json(), sort_keys=True)
+                         for user in users)
+        yield separator + chunk
+        separator = ","
+        after = users[-1].id
+    yield "]\n"
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size (1 to 1000); returns {"users": [...], "next":
+        cursor of the next page or null}, users being ordered by ID
+      - after: cursor returned as `next` by the previous page
+      - stream: "1" to stream the full list chunk by chunk
     Return:
       - list of all User objects JSON represented
+      - 304 if If-None-Match holds the ETag of the store generation
+      - 400 if the limit or the cursor is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    etag = User.generation()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    response = make_response(list_users())
+    if response.status_code == 200:
+        response.set_etag(etag)
+    return response
+
+
+def list_users() -> str:
+    """ Response of GET /api/v1/users, see view_all_users
+    """
+    after = request.args.get('after')
+    if after is not None:
+        after = decode_cursor(after)
+        if after is None:
+            return jsonify({'error': "Invalid cursor"}), 400
+    if request.args.get('stream') == "1":
+        return Response(stream_users(after), mimetype="application/json")
+    limit = request.args.get('limit')
+    if limit is None and after is None:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+
+    try:
+        limit = int(limit) if limit is not None else MAX_PAGE_SIZE
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': "Invalid limit"}), 400
+    users = User.page(limit, after)
+    next_cursor = None
+    if len(users) == limit:
+        next_cursor = encode_cursor(users[-1].id)
+    return jsonify({'users': [user.to_json() for user in users],
+                    'next': next_cursor})
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -23,6 +129,7 @@ def view_one_user(user_id: str = None) -> str:
       - User ID
     Return:
       - User object JSON represented
+      - 304 if If-None-Match holds the ETag of the User
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -30,7 +137,12 @@ def view_one_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = user_etag(user)
+    response = not_modified(etag)
+    if response is None:
+        response = jsonify(user.to_json())
+        response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -62,6 +174,7 @@ def create_user() -> str:
     Return:
       - User object JSON represented
       - 400 if can't create the new User
+      - 503 if the password can't be hashed for now
     """
     rj = None
     error_msg = None
@@ -84,11 +197,127 @@ def create_user() -> str:
             user.last_name = rj.get("last_name")
             user.save()
             return jsonify(user.to_json()), 201
+        except TimeoutError:
+            return jsonify({'error': "Too many requests, retry later"}), 503
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
     return jsonify({'error': error_msg}), 400
 
 
+def read_batch():
+    """ Items of a batch request: a JSON array, or one JSON object per
+    line for NDJSON; None if the body is neither, an item that isn't
+    valid JSON is None. At most MAX_BATCH_SIZE + 1 NDJSON items are read;
+    a body of more than MAX_BATCH_BYTES raises ValueError before it is
+    read in full
+    """
+    length = request.content_length
+    if length is not None and length > MAX_BATCH_BYTES:
+        raise ValueError("batch too large")
+    stream = request.stream
+    if request.mimetype not in NDJSON_MIMETYPES:
+        if not request.is_json:
+            return None
+        data = stream.read(MAX_BATCH_BYTES + 1)
+        if len(data) > MAX_BATCH_BYTES:
+            raise ValueError("batch too large")
+        try:
+            rj = json.loads(data)
+        except ValueError:
+            return None
+        return rj if isinstance(rj, list) else None
+    items = []
+    remaining = MAX_BATCH_BYTES
+    while len(items) <= MAX_BATCH_SIZE:
+        line = stream.readline(remaining + 1)
+        if not line:
+            break
+        remaining -= len(line)
+        if remaining < 0:
+            raise ValueError("batch too large")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items
+
+
+def validate_user(rj) -> str:
+    """ Error message of an invalid user JSON, None if valid
+    """
+    if not isinstance(rj, dict):
+        return "Wrong format"
+    if rj.get("email", "") == "":
+        return "email missing"
+    if rj.get("password", "") == "":
+        return "password missing"
+    return None
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/batch
+    Body: JSON array, or NDJSON (Content-Type application/x-ndjson), of
+    users with the same fields as POST /api/v1/users; passwords are
+    hashed in parallel and valid users are saved with one write
+    Return:
+      - {"created": n, "failed": n, "results": [...]} with, for each
+        item in order, its status and the created user or the error
+      - 400 if the body can't be read or holds more than 10000 users
+      - 413 if the body is larger than 10 MiB
+      - 503 if passwords can't be hashed for now
+    """
+    try:
+        items = read_batch()
+    except ValueError:
+        return jsonify({'error': "Batch too large"}), 413
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': "Too many users"}), 400
+
+    results = []
+    valid = []
+    for rj in items:
+        error_msg = validate_user(rj)
+        if error_msg is None:
+            valid.append(rj)
+            results.append(None)
+        else:
+            results.append({'status': 400, 'error': error_msg})
+    pwds = [rj.get("password") for rj in valid
+            if type(rj.get("password")) is str]
+    try:
+        hashes = iter(hash_passwords(pwds))
+    except TimeoutError:
+        return jsonify({'error': "Too many requests, retry later"}), 503
+
+    users = []
+    for rj in valid:
+        pwd = rj.get("password")
+        users.append(User(email=rj.get("email"),
+                          _password=next(hashes) if type(pwd) is str
+                          else None,
+                          first_name=rj.get("first_name"),
+                          last_name=rj.get("last_name")))
+    try:
+        User.save_many(users)
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+
+    created = iter(users)
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {'status': 201,
+                              'user': next(created).to_json()}
+    return jsonify({'created': len(users),
+                    'failed': len(results) - len(users),
+                    'results': results})
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """ PUT /api/v1/users/:id
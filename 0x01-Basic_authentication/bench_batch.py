@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" Benchmark of user creation: POST /api/v1/users one user at a time
+against POST /api/v1/users/batch
+Usage: ./bench_batch.py [USER_COUNT [BCRYPT_ROUNDS]]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from models import password
+from models.user import User
+
+
+def main():
+    """ Create the same number of users through both endpoints
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    password.BCRYPT_ROUNDS = sys.argv[2] if len(sys.argv) > 2 else "6"
+    password.bcrypt_rounds.cache_clear()
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app
+    client = app.test_client()
+    User.load_from_file()
+
+    users = [{"email": "user{}@example.com".format(i), "password": "pwd",
+              "first_name": "First", "last_name": "Last"}
+             for i in range(count)]
+    start = time.perf_counter()
+    for user in users:
+        assert client.post("/api/v1/users", json=user).status_code == 201
+    one_by_one = count / (time.perf_counter() - start)
+
+    for user in users:
+        user["email"] = "batch." + user["email"]
+    body = "\n".join(json.dumps(user) for user in users)
+    start = time.perf_counter()
+    response = client.post("/api/v1/users/batch", data=body,
+                           content_type="application/x-ndjson")
+    batch = count / (time.perf_counter() - start)
+    assert response.get_json()["created"] == count
+    assert User.count() == 2 * count
+    print("{} users, bcrypt cost {}: one by one {:8.0f} users/s, "
+          "batch {:8.0f} users/s".format(
+              count, password.bcrypt_rounds(), one_by_one, batch))
+
+
+if __name__ == "__main__":
+    main()
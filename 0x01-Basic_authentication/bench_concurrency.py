@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+""" Multithreaded stress test of the Base store
+Each thread creates, updates, looks up and removes users; the store,
+its indexes and the reloaded file are then checked for consistency.
+Usage: ./bench_concurrency.py [OPERATIONS_PER_THREAD]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from models.engine import file_storage
+from models.base import DATA, INDEXES, SORTED_IDS
+from models import password
+from models.user import User
+
+
+def worker(tid: str, operations: int, errors: list):
+    """ Mixed workload: 1 create, 1 update, 8 lookups per 10 operations
+    """
+    mine = []
+    try:
+        for i in range(operations):
+            step = i % 10
+            if step == 0:
+                user = User(email="{}-{}@example.com".format(tid, i))
+                user.password = "pwd"
+                user.save()
+                mine.append(user)
+            elif step == 1 and mine:
+                mine[-1].first_name = "F{}".format(i)
+                mine[-1].save()
+            elif step == 2 and len(mine) > 3:
+                mine.pop(0).remove()
+            else:
+                user = mine[-1]
+                assert User.get(user.id) is user
+                assert User.search({"email": user.email}) == [user]
+                User.count()
+    except Exception as e:
+        errors.append(e)
+
+
+def check_consistency():
+    """ Cross-check DATA, the indexes and the file on disk
+    """
+    users = dict(DATA["User"])
+    assert SORTED_IDS["User"] == sorted(users)
+    buckets, values = INDEXES["User"]["email"]
+    assert values == {i: u.email for i, u in users.items()}
+    for user in users.values():
+        assert buckets[user.email][user.id] is user
+    expected = {i: u.to_json(True) for i, u in users.items()}
+    User.load_from_file()
+    assert {i: u.to_json(True) for i, u in DATA["User"].items()} == expected
+
+
+def main():
+    """ Run the workload with 1 to 8 threads
+    """
+    # legacy SHA256 hashes: bcrypt would dominate every timing
+    password.SCHEME = "sha256"
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if "BASE_STORAGE_MODE" not in os.environ:
+        file_storage.STORAGE_MODE = "journal"
+    os.chdir(tempfile.mkdtemp())
+    for threads in (1, 2, 4, 8):
+        User.load_from_file()
+        errors = []
+        pool = [threading.Thread(
+            target=worker,
+            args=("{}.{}".format(threads, t), operations, errors))
+            for t in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        assert not errors, errors
+        check_consistency()
+        print("{} threads: {:8.0f} ops/s, consistent".format(
+            threads, threads * operations / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory held per user in DATA
+Usage: ./bench_memory.py [USER_COUNT ...]
+"""
+import gc
+import hashlib
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from models import base
+from models import password
+from models.user import User
+
+
+class LegacyUser():
+    """ User layout before slots: one __dict__ per instance
+    """
+
+    def __init__(self, email: str, pwd: str):
+        """ Initialize a LegacyUser like User used to
+        """
+        self.id = str(uuid.uuid4())
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.email = email
+        self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+        self.first_name = None
+        self.last_name = None
+
+
+def bytes_per_user(factory, count: int) -> float:
+    """ Memory allocated per object kept alive in a dict by id
+    """
+    gc.collect()
+    tracemalloc.start()
+    objs = {}
+    for i in range(count):
+        obj = factory("user{}@example.com".format(i), "pwd{}".format(i))
+        objs[obj.id] = obj
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / count
+
+
+def new_user(email: str, pwd: str) -> User:
+    """ Build a User the way the API does
+    """
+    user = User(email=email)
+    user.password = pwd
+    return user
+
+
+def main():
+    """ Compare the legacy, slotted and compact layouts
+    """
+    # SHA256 digests, which compact mode stores as raw bytes
+    password.SCHEME = "sha256"
+    counts = [int(c) for c in sys.argv[1:]] or [100000, 1000000]
+    for count in counts:
+        legacy = bytes_per_user(LegacyUser, count)
+        base.COMPACT_MODELS = False
+        slotted = bytes_per_user(new_user, count)
+        base.COMPACT_MODELS = True
+        compact = bytes_per_user(new_user, count)
+        print("{:>9} users: legacy {:5.0f} B, slots {:5.0f} B, "
+              "slots + compact {:5.0f} B per user"
+              .format(count, legacy, slotted, compact))
+
+
+if __name__ == "__main__":
+    main()
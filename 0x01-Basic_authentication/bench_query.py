@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Benchmark of Base.search on prefix, range and limited queries, with
+the sorted indexes of User and with a full scan
+Usage: ./bench_query.py [USER_COUNT]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from models import password
+from models.user import User
+
+
+def per_query(func, rounds: int = 200) -> float:
+    """ Microseconds per call of func()
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def run(start: datetime) -> list:
+    """ Time each query on the users in memory
+    """
+    queries = (
+        ("email prefix", {"email__prefix": "user42"}, None),
+        ("created_at range", {"created_at__gte": start + timedelta(days=10),
+                              "created_at__lt": start + timedelta(days=11)},
+         None),
+        ("first 50 by prefix", {"email__prefix": "user"}, 50),
+        ("email in", {"email__in": ["user{}@example.com".format(i)
+                                    for i in range(0, 1000, 10)]}, None),
+    )
+    return [(name, len(User.search(attributes, limit)),
+             per_query(lambda: User.search(attributes, limit)))
+            for name, attributes, limit in queries]
+
+
+def main():
+    """ Compare the queries with and without sorted indexes
+    """
+    # legacy SHA256 hashes: bcrypt would dominate the setup
+    password.SCHEME = "sha256"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    start = datetime(2020, 1, 1)
+    users = []
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i))
+        user.created_at = start + timedelta(minutes=i)
+        users.append(user)
+    User.save_many(users)
+    indexed = run(start)
+    # drop the indexes: every query scans the store
+    sorted_attributes, indexed_attributes = \
+        User.SORTED_ATTRIBUTES, User.INDEXED_ATTRIBUTES
+    User.SORTED_ATTRIBUTES, User.INDEXED_ATTRIBUTES = {}, ()
+    User.rebuild_indexes()
+    scanned = run(start)
+    User.SORTED_ATTRIBUTES, User.INDEXED_ATTRIBUTES = \
+        sorted_attributes, indexed_attributes
+    User.rebuild_indexes()
+    print("{} users, microseconds per query".format(count))
+    for (name, found, fast), (_, _, slow) in zip(indexed, scanned):
+        print("{:>20}: {:6} found, indexed {:9.1f}, scan {:9.1f} ({:.0f}x)"
+              .format(name, found, fast, slow, slow / fast))
+
+
+if __name__ == "__main__":
+    main()
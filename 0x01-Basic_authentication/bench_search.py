@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+""" Benchmark of the login lookup (search by email) against user count
+Usage: ./bench_search.py [USER_COUNT ...]
+"""
+import sys
+import timeit
+
+from api.v1.auth.basic_auth import BasicAuth
+from models.base import DATA
+from models import password
+from models.user import User
+
+
+def populate(count: int):
+    """ Fill DATA with `count` users without touching the disk
+    """
+    DATA["User"] = {}
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i))
+        user.password = "pwd{}".format(i)
+        DATA["User"][user.id] = user
+    User.rebuild_indexes()
+
+
+def main():
+    """ Time a login with and without the email index
+    """
+    # legacy SHA256 hashes: bcrypt would dominate every timing
+    password.SCHEME = "sha256"
+    counts = [int(c) for c in sys.argv[1:]] or [1000, 10000, 100000]
+    auth = BasicAuth()
+    for count in counts:
+        populate(count)
+        email = "user{}@example.com".format(count // 2)
+        pwd = "pwd{}".format(count // 2)
+        assert auth.user_object_from_credentials(email, pwd) is not None
+        number = 1000
+        indexed = timeit.timeit(
+            lambda: auth.user_object_from_credentials(email, pwd),
+            number=number) / number
+        scan = timeit.timeit(
+            lambda: [u for u in DATA["User"].values() if u.email == email],
+            number=10) / 10
+        print("{:>9} users: indexed login {:8.2f} us, linear scan {:10.2f} us"
+              .format(count, indexed * 1e6, scan * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" Benchmark of the to_json() cache on GET /api/v1/users and
+save_to_file: every object serialized afresh (cold) or unchanged since
+its last serialization (warm)
+Usage: ./bench_serialize.py [USER_COUNT]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from models import password
+from models.base import DATA
+from models.user import User
+
+
+def drop_caches():
+    """ Forget the cached JSON forms of every user
+    """
+    for user in DATA["User"].values():
+        object.__setattr__(user, '_json_cache', None)
+
+
+def timed(func, cold: bool) -> float:
+    """ Best time of 3 calls of `func`, with or without cached forms
+    """
+    best = None
+    for _ in range(3):
+        if cold:
+            drop_caches()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """ Time both paths cold and warm
+    """
+    password.SCHEME = "sha256"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app
+    client = app.test_client()
+    DATA["User"] = {}
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First", last_name="Last")
+        user.password = "pwd"
+        DATA["User"][user.id] = user
+    User.rebuild_indexes()
+
+    def get_users():
+        assert client.get("/api/v1/users").status_code == 200
+
+    def save():
+        User.save_to_file(durable=True)
+
+    for name, func in (("GET /api/v1/users", get_users),
+                       ("save_to_file", save)):
+        cold = timed(func, True)
+        warm = timed(func, False)
+        print("{} users, {:>17}: cold {:6.3f}s, warm {:6.3f}s ({:.1f}x)"
+              .format(count, name, cold, warm, cold / warm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+""" Benchmark of User.load_from_file (cold start) against user count
+Usage: ./bench_startup.py [USER_COUNT ...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from models.base import DATA
+from models import password
+from models.engine.file_storage import binary_snapshot_path
+from models.user import User
+
+
+def timed(func) -> float:
+    """ Seconds taken by one call of `func`
+    """
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def legacy_load():
+    """ load_from_file as it was: json.load then cls(**obj_json)
+    """
+    with open(".db_User.json", 'r') as f:
+        objs_json = json.load(f)
+        DATA["User"] = {obj_id: User(**obj_json)
+                        for obj_id, obj_json in objs_json.items()}
+
+
+def main():
+    """ Time the legacy, JSON and binary loading paths
+    """
+    # legacy SHA256 hashes: bcrypt would dominate every timing
+    password.SCHEME = "sha256"
+    counts = [int(c) for c in sys.argv[1:]] or [10000, 100000]
+    os.chdir(tempfile.mkdtemp())
+    for count in counts:
+        DATA["User"] = {}
+        for i in range(count):
+            user = User(email="user{}@example.com".format(i),
+                        first_name="First", last_name="Last")
+            user.password = "pwd"
+            DATA["User"][user.id] = user
+        User.save_to_file(durable=True)
+
+        binary = timed(User.load_from_file)
+        assert User.count() == count
+        os.rename(binary_snapshot_path(".db_User.json"), "bin.bak")
+        from_json = timed(User.load_from_file)
+        os.rename("bin.bak", binary_snapshot_path(".db_User.json"))
+        legacy = timed(legacy_load)
+        print("{:>9} users: legacy {:6.2f}s, json {:6.2f}s, binary {:6.2f}s"
+              .format(count, legacy, from_json, binary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Benchmark of the storage backends: create, get and search by email
+(indexed in memory) or by first name (pushed down to SQLite)
+Usage: ./bench_storage.py [USER_COUNT]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from models import base
+from models import password
+from models.engine import file_storage
+from models.engine.file_storage import FileStorage
+from models.engine.sqlite_storage import SQLiteStorage
+from models.user import User
+
+
+def per_op(func, count: int) -> float:
+    """ Microseconds per call of func(i) for i in range(count)
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(count: int) -> tuple:
+    """ Time each operation on the current storage in a fresh directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    ids = []
+
+    def create(i):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i % 100))
+        user.password = "pwd"
+        user.save()
+        ids.append(user.id)
+
+    created = per_op(create, count)
+    User.load_from_file()
+    assert User.count() == count
+    got = per_op(lambda i: User.get(ids[i]), count)
+    by_email = per_op(lambda i: User.search(
+        {"email": "user{}@example.com".format(i)}), count)
+    by_name = per_op(lambda i: User.search(
+        {"first_name": "First{}".format(i % 100)}), 200)
+    return created, got, by_email, by_name
+
+
+def main():
+    """ Compare the file, journal and sqlite backends
+    """
+    # legacy SHA256 hashes: bcrypt would dominate every timing
+    password.SCHEME = "sha256"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    backends = (("file", FileStorage, "file"),
+                ("journal", FileStorage, "journal"),
+                ("sqlite", SQLiteStorage, None))
+    print("{} users, microseconds per operation".format(count))
+    for name, storage, mode in backends:
+        if mode is not None:
+            file_storage.STORAGE_MODE = mode
+        base.STORAGE = storage()
+        print("{:>8}: create {:9.1f}, get {:6.2f}, search email {:6.2f}, "
+              "search first_name {:9.1f}".format(name, *run(count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" Load test of Basic logins: latency of a legitimate user alone, then
+during a credential-stuffing attack without and with the login throttle
+Each attacker sends up to RATE requests per second.
+Usage: ./bench_throttle.py [SECONDS [ATTACKERS [RATE [BCRYPT_ROUNDS]]]]
+"""
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from api.v1.auth.basic_auth import BasicAuth
+from api.v1.auth.login_throttle import LoginThrottle
+from models import password
+from models.user import User
+
+
+class Request:
+    """ Bare request: an Authorization header and a client address
+    """
+
+    def __init__(self, email: str, pwd: str, address: str):
+        """ Initialize a request of `email`:`pwd` from `address`
+        """
+        credentials = "{}:{}".format(email, pwd).encode()
+        self.headers = {"Authorization": "Basic " +
+                        base64.b64encode(credentials).decode()}
+        self.remote_addr = address
+
+
+def attack(auth: BasicAuth, address: str, users: int, rate: float,
+           stop: threading.Event, attempts: list):
+    """ Try wrong passwords on every account from `address`, `rate`
+    times per second at most, until stopped
+    """
+    i = 0
+    start = time.perf_counter()
+    while not stop.is_set():
+        email = "user{}@example.com".format(i % users)
+        auth.current_user(Request(email, "guess{}".format(i), address))
+        attempts.append(1)
+        i += 1
+        stop.wait(start + i / rate - time.perf_counter())
+
+
+def run(auth: BasicAuth, seconds: float, attackers: int, rate: float,
+        users: int) -> tuple:
+    """ Log the legitimate user in for `seconds` while `attackers`
+    threads attack; return its latencies and the number of attacks
+    """
+    stop = threading.Event()
+    attempts = []
+    threads = [threading.Thread(target=attack, args=(
+        auth, "10.0.0.{}".format(i), users, rate, stop, attempts))
+        for i in range(attackers)]
+    for thread in threads:
+        thread.start()
+    request = Request("legit@example.com", "secret", "192.168.0.1")
+    latencies = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        assert auth.current_user(request) is not None
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, len(attempts)
+
+
+def main():
+    """ Compare the legitimate latency alone and under attack
+    """
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    attackers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 25
+    password.BCRYPT_ROUNDS = sys.argv[4] if len(sys.argv) > 4 else "8"
+    password.bcrypt_rounds.cache_clear()
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    users = 100
+    objs = [User(email="user{}@example.com".format(i)) for i in range(users)]
+    for user, hashed in zip(objs, password.hash_passwords(
+            ["pwd"] * users)):
+        user._password = hashed
+    legit = User(email="legit@example.com")
+    legit.password = "secret"
+    User.save_many(objs + [legit])
+    # every legitimate login is verified, not served from the cache
+    BasicAuth.credential_cache.enabled = False
+    auth = BasicAuth()
+
+    print("{} attackers at {} requests/s, bcrypt cost {}, legitimate login "
+          "latency in ms".format(attackers, rate, password.bcrypt_rounds()))
+    # a burst of 10 attempts by address, so a short run gets past it
+    for name, throttle, count in (
+            ("alone", LoginThrottle(address_burst=10), 0),
+            ("attack, no throttle", LoginThrottle(max_keys=0), attackers),
+            ("attack, throttle", LoginThrottle(address_burst=10),
+             attackers)):
+        BasicAuth.login_throttle = throttle
+        latencies, attempts = run(auth, seconds, count, rate, users)
+        print("{:>20}: p50 {:7.2f}, p99 {:7.2f}, {:7} attacks/s {}".format(
+            name, latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3,
+            round(attempts / seconds), throttle.stats()))
+
+
+if __name__ == "__main__":
+    main()
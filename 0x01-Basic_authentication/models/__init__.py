@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+""" Models package
+models.base is always loaded first: the storage backends of models.engine
+use its store and base creates the configured one when it is loaded
+"""
+from models import base  # noqa: F401
@@ -1,27 +1,268 @@
 #!/usr/bin/env python3
 """ Base module
+
+Concurrency model: every class shares the in-memory store (DATA, INDEXES,
+SORTED_INDEXES, SORTED_IDS) guarded by STORE_LOCK, a readers/writer lock.
+Lookups (get, search, count, page, all) hold it shared and run
+concurrently; mutations (save, remove, load_from_file) hold it
+exclusively, so they are serialized and readers never see a half-applied
+change. Snapshots are
+serialized under the shared lock, so writers wait while a consistent
+copy is taken, but not while it is written to disk in journal mode.
+Observers are notified after the lock is released.
+
+Objects are persisted by STORAGE, a backend of models.engine; its own
+locks are always taken after STORE_LOCK.
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from typing import (
+    Callable, Dict, TypeVar, List, Iterable, Iterator, Tuple
+)
+from os import getenv
+import bisect
+import hashlib
+import itertools
 import json
+import operator
+import sys
+import threading
 import uuid
 
+from models.engine import get_storage
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# "1" stores timestamps as integer microseconds since EPOCH (and lets
+# subclasses store digests as bytes) instead of datetime objects
+COMPACT_MODELS = getenv("BASE_COMPACT_MODELS", "0") == "1"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
 DATA = {}
+# class name -> attribute -> ({value: {id: obj}}, {id: value}),
+# unhashable values left out
+INDEXES = {}
+# class name -> attribute -> ([sorted values], [their ids], {id: value}),
+# None values and those not of the type of the index left out
+SORTED_INDEXES = {}
+# class name -> sorted list of ids, the stable order of page()
+SORTED_IDS = {}
+# class name -> {id: obj} of the stored objects changed in memory since
+# their last save, which indexes and backends don't know about yet
+UNSAVED = {}
+# class name -> {id: obj} of the stored objects with a value an index
+# can't hold, which search() checks on their own like UNSAVED ones
+UNINDEXED = {}
+# search() operators, used as "<attribute>__<operator>" keys
+OPERATORS = ('eq', 'in', 'prefix', 'gt', 'gte', 'lt', 'lte')
+COMPARISONS = {'gt': operator.gt, 'gte': operator.ge,
+               'lt': operator.lt, 'lte': operator.le}
+# callables notified with (obj, "save" | "remove") after each mutation
+OBSERVERS: List[Callable[[TypeVar('Base'), str], None]] = []
+# bumped, under the write lock, whenever objects are stored, removed or
+# reloaded; the token tells apart the counters of two processes
+GENERATION = 0
+GENERATION_TOKEN = uuid.uuid4().hex[:8]
+
+
+class RWLock():
+    """ Readers/writer lock, preferring writers
+
+    The writing thread may take the lock again, shared or exclusive, and
+    a reading thread may take it shared again; upgrading a shared lock to
+    an exclusive one deadlocks.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked lock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        """ Take the lock shared
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._local.depth = 1
+
+    def release_read(self):
+        """ Release a shared hold
+        """
+        self._local.depth -= 1
+        if self._local.depth or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """ Take the lock exclusively
+        """
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writer_depth += 1
+            return
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        """ Release an exclusive hold
+        """
+        self._writer_depth -= 1
+        if self._writer_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """ Hold the lock shared for the `with` block
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """ Hold the lock exclusively for the `with` block
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+STORE_LOCK = RWLock()
+# bypasses Base.__setattr__ where the JSON cache is managed directly
+_setattr = object.__setattr__
+
+
+def bump_generation():
+    """ Record that the store changed; the caller holds the write lock
+    """
+    global GENERATION
+    GENERATION += 1
+
+
+def notify(obj: TypeVar('Base'), event: str):
+    """ Notify every registered observer of a mutation
+    """
+    for observer in OBSERVERS:
+        observer(obj, event)
+
+
+def parse_condition(key: str, value) -> Tuple[str, str, object, Callable]:
+    """ Split a search() key into attribute and operator, and return
+    them with the value and a test of an attribute value against it
+    """
+    attr, _, op = key.partition('__')
+    op = op or 'eq'
+    if op == 'eq':
+        def test(x):
+            return x == value
+    elif op == 'in':
+        value = list(value)
+
+        def test(x):
+            return x in value
+    elif op == 'prefix':
+        def test(x):
+            return isinstance(x, str) and x.startswith(value)
+    elif op in COMPARISONS:
+        compare = COMPARISONS[op]
+
+        def test(x):
+            try:
+                return x is not None and compare(x, value)
+            except TypeError:
+                return False
+    else:
+        raise ValueError("unknown search operator: {}".format(key))
+    return attr, op, value, test
+
+
+def sorted_bounds(values: list, op: str, value) -> Tuple[int, int]:
+    """ Slice of the sorted `values` where a condition may hold
+    """
+    if op == 'eq':
+        return (bisect.bisect_left(values, value),
+                bisect.bisect_right(values, value))
+    if op == 'gt':
+        return bisect.bisect_right(values, value), len(values)
+    if op == 'gte':
+        return bisect.bisect_left(values, value), len(values)
+    if op == 'lt':
+        return 0, bisect.bisect_left(values, value)
+    if op == 'lte':
+        return 0, bisect.bisect_right(values, value)
+    # prefix: from the prefix up to its successor, its last character
+    # bumped, or to the end when there is none
+    low = bisect.bisect_left(values, value)
+    if value and ord(value[-1]) < sys.maxunicode:
+        successor = value[:-1] + chr(ord(value[-1]) + 1)
+        return low, bisect.bisect_left(values, successor)
+    return low, len(values)
+
+
+# backend persisting the objects, see models.engine
+STORAGE = get_storage()
 
 
 class Base():
     """ Base class
+
+    Instances are slotted: a subclass declares the slots it stores in
+    __slots__ and every serialized attribute, in order, in ATTRIBUTES.
+
+    to_json() results are cached per instance until the next attribute
+    assignment (save() assigns updated_at).
     """
 
+    # _json_cache: [public form, form for serialization, digest of the
+    # public form], each None until computed
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+    # attributes serialized by to_json() and restored by load_from_file()
+    ATTRIBUTES: Tuple[str, ...] = ('id', 'created_at', 'updated_at')
+    # attributes with a hash index, used by search() on equality;
+    # they are indexed as of the last save(), search() checks the objects
+    # changed since, and those with an unhashable value, on their own
+    INDEXED_ATTRIBUTES: Tuple[str, ...] = ()
+    # attributes with a sorted index, used by search() on ranges and
+    # prefixes, mapped to the type of the values it holds; None and values
+    # of other types are left out of the index
+    SORTED_ATTRIBUTES: Dict[str, type] = {}
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        if DATA.get(s_class) is None or s_class not in INDEXES:
+            with STORE_LOCK.write():
+                if DATA.get(s_class) is None:
+                    DATA[s_class] = {}
+                if s_class not in INDEXES:
+                    self.__class__.rebuild_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
@@ -35,6 +276,47 @@ class Base():
         else:
             self.updated_at = datetime.utcnow()
 
+    @staticmethod
+    def _store_timestamp(value: datetime):
+        """ Storage form of a timestamp: microseconds since EPOCH in
+        compact mode, the datetime itself otherwise
+        """
+        if COMPACT_MODELS and type(value) is datetime:
+            return (value - EPOCH) // MICROSECOND
+        return value
+
+    @staticmethod
+    def _load_timestamp(value) -> datetime:
+        """ datetime of a stored timestamp
+        """
+        if type(value) is int:
+            return EPOCH + timedelta(microseconds=value)
+        return value
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation date
+        """
+        return self._load_timestamp(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation date
+        """
+        _setattr(self, '_created_at', self._store_timestamp(value))
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update date
+        """
+        return self._load_timestamp(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update date
+        """
+        _setattr(self, '_updated_at', self._store_timestamp(value))
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -44,69 +326,372 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, drop the cached JSON forms and, for a
+        stored object, record it as changed until its next save
+        """
+        _setattr(self, name, value)
+        _setattr(self, '_json_cache', None)
+        s_class = type(self).__name__
+        objs = DATA.get(s_class)
+        if objs:
+            try:
+                stored = objs.get(self.id) is self
+            except AttributeError:
+                # being initialized, no id yet
+                return
+            if stored:
+                UNSAVED.setdefault(s_class, {})[self.id] = self
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [None, None, None]
+            _setattr(self, '_json_cache', cache)
+        result = cache[for_serialization]
+        if result is None:
+            result = {}
+            for key in self.ATTRIBUTES:
+                if not for_serialization and key[0] == '_':
+                    continue
+                value = getattr(self, key)
+                if type(value) is datetime:
+                    result[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    result[key] = value
+            cache[for_serialization] = result
+        # callers own their copy, the cached one must stay intact
+        return dict(result)
+
+    def digest(self) -> str:
+        """ Hex digest of to_json(), changed by any change of the public
+        form, including one made by another process within the same second
+        """
+        while True:
+            # the digest is kept next to the public form it was made from
+            cache = getattr(self, '_json_cache', None)
+            if cache is not None and cache[0] is not None:
+                break
+            self.to_json()
+        if cache[2] is None:
+            serialized = json.dumps(cache[0], sort_keys=True, default=str)
+            cache[2] = hashlib.blake2b(serialized.encode(),
+                                       digest_size=16).hexdigest()
+        return cache[2]
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from the storage
+        """
+        STORAGE.load(cls)
+
+    @staticmethod
+    def _parse_timestamp(value: str) -> datetime:
+        """ Parse a TIMESTAMP_FORMAT string, utcnow() for None like
+        __init__; fromisoformat is much cheaper than strptime
+        """
+        if value is None:
+            return datetime.utcnow()
+        return datetime.fromisoformat(value)
+
+    @classmethod
+    def _loader(cls) -> Callable[[dict], TypeVar('Base')]:
+        """ Return a function building objects from their serialized form
+        like cls(**obj_json) would, without going through __init__
+        """
+        keys = cls.ATTRIBUTES
+        timestamps = [k for k in ('created_at', 'updated_at') if k in keys]
+        parse = cls._parse_timestamp
+        new = cls.__new__
+
+        def build(obj_json: dict) -> TypeVar('Base'):
+            values = {key: obj_json.get(key) for key in keys}
+            for key in timestamps:
+                values[key] = parse(values[key])
+            if 'id' not in obj_json:
+                values['id'] = str(uuid.uuid4())
+            obj = new(cls)
+            for key, value in values.items():
+                _setattr(obj, key, value)
+            return obj
+
+        return build
+
+    @classmethod
+    def _from_columns(cls, fields: Tuple[str, ...],
+                      columns: List[list]) -> Iterable[TypeVar('Base')]:
+        """ Build objects from the columns of a binary snapshot
+        """
+        count = len(columns[0]) if columns else 0
+        keys = cls.ATTRIBUTES
+        ordered = []
+        for key in keys:
+            if key in fields:
+                column = columns[fields.index(key)]
+            elif key == 'id':
+                column = [str(uuid.uuid4()) for _ in range(count)]
+            else:
+                column = [None] * count
+            if key in ('created_at', 'updated_at'):
+                column = list(map(cls._parse_timestamp, column))
+            ordered.append(column)
+        new = cls.__new__
+        for values in zip(*ordered):
+            obj = new(cls)
+            for key, value in zip(keys, values):
+                _setattr(obj, key, value)
+            yield obj
+
+    @classmethod
+    def rebuild_indexes(cls):
+        """ Rebuild the attribute indexes from DATA
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        with STORE_LOCK.write():
+            objs = DATA.get(s_class, {})
+            SORTED_IDS[s_class] = sorted(objs)
+            UNSAVED[s_class] = {}
+            unindexed = UNINDEXED[s_class] = {}
+            indexes = {}
+            for attr in cls.INDEXED_ATTRIBUTES:
+                buckets, values = {}, {}
+                for obj in objs.values():
+                    value = getattr(obj, attr, None)
+                    try:
+                        bucket = buckets.setdefault(value, {})
+                    except TypeError:
+                        unindexed[obj.id] = obj
+                        continue
+                    bucket[obj.id] = obj
+                    values[obj.id] = value
+                indexes[attr] = (buckets, values)
+            INDEXES[s_class] = indexes
+            sorted_indexes = {}
+            for attr, kind in cls.SORTED_ATTRIBUTES.items():
+                pairs = []
+                for obj in objs.values():
+                    value = getattr(obj, attr, None)
+                    if isinstance(value, kind):
+                        pairs.append((value, obj.id))
+                    elif value is not None:
+                        unindexed[obj.id] = obj
+                pairs.sort()
+                sorted_indexes[attr] = ([value for value, _ in pairs],
+                                        [i for _, i in pairs],
+                                        {i: value for value, i in pairs})
+            SORTED_INDEXES[s_class] = sorted_indexes
+            bump_generation()
+
+    def _store(self):
+        """ Put the current object in the store and its indexes
+        """
+        s_class = self.__class__.__name__
+        with STORE_LOCK.write():
+            if self.id not in DATA[s_class]:
+                bisect.insort(SORTED_IDS[s_class], self.id)
+            DATA[s_class][self.id] = self
+            self._index()
+            bump_generation()
+
+    def _unstore(self):
+        """ Take the current object out of the store and its indexes
+        """
+        s_class = self.__class__.__name__
+        with STORE_LOCK.write():
+            del DATA[s_class][self.id]
+            ids = SORTED_IDS[s_class]
+            del ids[bisect.bisect_left(ids, self.id)]
+            UNSAVED.get(s_class, {}).pop(self.id, None)
+            UNINDEXED.get(s_class, {}).pop(self.id, None)
+            self._unindex()
+            bump_generation()
+
+    def _index(self):
+        """ Update the attribute indexes with the current object; a value
+        an index can't hold is left out, the object is then in UNINDEXED
+        """
+        s_class = self.__class__.__name__
+        UNSAVED.get(s_class, {}).pop(self.id, None)
+        unindexed = False
+        indexes = INDEXES.get(s_class)
+        if indexes:
+            for attr, (buckets, values) in indexes.items():
+                value = getattr(self, attr, None)
+                try:
+                    hash(value)
+                except TypeError:
+                    unindexed = True
+                    if self.id in values:
+                        self._unindex_value(buckets, values.pop(self.id))
+                    continue
+                if self.id in values:
+                    old = values[self.id]
+                    if old == value and buckets[old].get(self.id) is self:
+                        continue
+                    self._unindex_value(buckets, old)
+                buckets.setdefault(value, {})[self.id] = self
+                values[self.id] = value
+        sorted_indexes = SORTED_INDEXES.get(s_class)
+        if sorted_indexes:
+            kinds = self.SORTED_ATTRIBUTES
+            for attr, (values, ids, current) in sorted_indexes.items():
+                value = getattr(self, attr, None)
+                if value is not None and not isinstance(value, kinds[attr]):
+                    unindexed = True
+                    value = None
+                if self.id in current:
+                    if current[self.id] == value:
+                        continue
+                    self._unindex_sorted(values, ids, current.pop(self.id))
+                if value is not None:
+                    try:
+                        i = bisect.bisect_right(values, value)
+                    except TypeError:
+                        # e.g. a timezone-aware datetime among naive ones
+                        unindexed = True
+                        continue
+                    values.insert(i, value)
+                    ids.insert(i, self.id)
+                    current[self.id] = value
+        if unindexed:
+            UNINDEXED.setdefault(s_class, {})[self.id] = self
+        else:
+            UNINDEXED.get(s_class, {}).pop(self.id, None)
+
+    def _unindex(self):
+        """ Remove the current object from the attribute indexes
+        """
+        s_class = self.__class__.__name__
+        for buckets, values in (INDEXES.get(s_class) or {}).values():
+            if self.id in values:
+                self._unindex_value(buckets, values.pop(self.id))
+        for values, ids, current in \
+                (SORTED_INDEXES.get(s_class) or {}).values():
+            if self.id in current:
+                self._unindex_sorted(values, ids, current.pop(self.id))
+
+    def _unindex_sorted(self, values: list, ids: list, value):
+        """ Remove the current object id from a sorted index, where it
+        was stored under `value`
+        """
+        i = ids.index(self.id, bisect.bisect_left(values, value),
+                      bisect.bisect_right(values, value))
+        del values[i]
+        del ids[i]
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    def _unindex_value(self, buckets: dict, value):
+        """ Remove the current object id from the bucket of `value`
+        """
+        bucket = buckets.get(value)
+        if bucket is not None:
+            bucket.pop(self.id, None)
+            if not bucket:
+                del buckets[value]
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def save_to_file(cls, durable: bool = False):
+        """ Save all objects to the storage
+        In write-behind mode the class is only marked dirty unless
+        `durable` is set
+        """
+        STORAGE.save_all(cls, durable)
+
+    @classmethod
+    def _snapshot(cls) -> dict:
+        """ Serialize all objects of the class
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with STORE_LOCK.read():
+            objs_json = {}
+            for obj_id, obj in DATA[s_class].items():
+                objs_json[obj_id] = obj.to_json(True)
+        return objs_json
+
+    @classmethod
+    def compact(cls, force: bool = False):
+        """ Fold the journal into a new snapshot; unless `force` is set
+        this is skipped when there is no journal to fold
+        """
+        STORAGE.compact(cls, force)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Persist the pending write-behind mutations of the class and
+        its subclasses (of every class when called on Base)
+        """
+        STORAGE.flush(cls)
 
-    def save(self):
+    def save(self, durable: bool = False):
         """ Save current object
+        `durable` forces a synchronous write in write-behind mode
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        cls = self.__class__
+        with STORE_LOCK.write(), STORAGE.lock(cls):
+            STORAGE.sync(cls, force=True)
+            self.updated_at = datetime.utcnow()
+            self._store()
+            STORAGE.persist(self, "save", durable)
+        notify(self, "save")
+
+    @classmethod
+    def save_many(cls, objs: List[TypeVar('Base')], durable: bool = False):
+        """ Save several objects of the class in one step, persisted with
+        a single write
+        """
+        s_class = cls.__name__
+        with STORE_LOCK.write(), STORAGE.lock(cls):
+            STORAGE.sync(cls, force=True)
+            now = datetime.utcnow()
+            objs_by_id = DATA[s_class]
+            new_ids = []
+            for obj in objs:
+                obj.updated_at = now
+                if obj.id not in objs_by_id:
+                    new_ids.append(obj.id)
+                objs_by_id[obj.id] = obj
+                obj._index()
+            if new_ids:
+                # one sort of the merged list beats an insort per object
+                ids = SORTED_IDS[s_class]
+                ids.extend(dict.fromkeys(new_ids))
+                ids.sort()
+            bump_generation()
+            STORAGE.persist_many(cls, objs, durable)
+        for obj in objs:
+            notify(obj, "save")
 
-    def remove(self):
+    def remove(self, durable: bool = False):
         """ Remove object
+        `durable` forces a synchronous write in write-behind mode
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        cls = self.__class__
+        s_class = cls.__name__
+        with STORE_LOCK.write(), STORAGE.lock(cls):
+            STORAGE.sync(cls, force=True)
+            if DATA[s_class].get(self.id) is None:
+                return
+            self._unstore()
+            STORAGE.persist(self, "remove", durable)
+        notify(self, "remove")
+
+    @classmethod
+    def generation(cls) -> str:
+        """ Version of the whole store, changed by every save, remove or
+        load of any class
+        """
+        STORAGE.sync(cls)
+        return "{}-{}".format(GENERATION_TOKEN, GENERATION)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        STORAGE.sync(cls)
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        with STORE_LOCK.read():
+            return len(DATA[s_class].keys())
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +699,121 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, limit: int, after: str = None) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects ordered by id, starting after
+        the id `after`
+        """
+        STORAGE.sync(cls)
+        s_class = cls.__name__
+        with STORE_LOCK.read():
+            ids = SORTED_IDS[s_class]
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            objs = DATA[s_class]
+            return [objs[obj_id] for obj_id in ids[start:start + limit]]
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        STORAGE.sync(cls)
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        with STORE_LOCK.read():
+            return DATA[s_class].get(id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+    def search(cls, attributes: dict = {},
+               limit: int = None) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        A key is an attribute name, matched on equality, or
+        "<attribute>__<operator>" with one of OPERATORS: "in" (a value of
+        an iterable), "prefix" (of a string), "gt", "gte", "lt" or "lte".
+        At most `limit` objects are returned, in the order of the index
+        used, else of insertion. Objects are matched on their values in
+        memory, saved or not, whatever the index or backend used.
+        """
+        STORAGE.sync(cls)
+        conditions = [parse_condition(k, v) for k, v in attributes.items()]
+        tests = [(attr, test) for attr, _, _, test in conditions]
+        result = []
+        if limit is not None and limit <= 0:
+            return result
+
+        with STORE_LOCK.read():
+            s_class = cls.__name__
+            objs = DATA[s_class]
+            candidates = cls._plan(conditions)
+            if candidates is None:
+                equal = {attr: value for attr, op, value, _ in conditions
+                         if op == 'eq'}
+                if equal:
+                    # let the backend filter on what was last saved, the
+                    # objects in memory are still checked below
+                    ids = STORAGE.search_ids(cls, equal)
+                    if ids is not None:
+                        candidates = [objs[i] for i in ids if i in objs]
+            if candidates is None:
+                candidates = objs.values()
+            else:
+                # indexes and backends know the objects as last saved and
+                # indexable: the ones changed since or left out of an
+                # index are checked as well
+                unsaved = dict(UNINDEXED.get(s_class) or {})
+                unsaved.update(UNSAVED.get(s_class) or {})
+                if unsaved:
+                    candidates = itertools.chain(
+                        (obj for obj in candidates if obj.id not in unsaved),
+                        unsaved.values())
+            for obj in candidates:
+                for attr, test in tests:
+                    if not test(getattr(obj, attr)):
+                        break
+                else:
+                    result.append(obj)
+                    if len(result) == limit:
+                        break
+            return result
+
+    @classmethod
+    def _plan(cls, conditions: list) -> Iterable[TypeVar('Base')]:
+        """ Candidates of a search from the most selective index matching
+        its conditions, or None when no index applies; the caller holds
+        the read lock
         """
         s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        objs = DATA[s_class]
+        indexes = INDEXES.get(s_class) or {}
+        sorted_indexes = SORTED_INDEXES.get(s_class) or {}
+        # (number of candidates, at most, and a lazy iterable of them)
+        plans = []
+        ranges = {}
+        for attr, op, value, _ in conditions:
+            try:
+                if attr == 'id' and op in ('eq', 'in'):
+                    ids = [value] if op == 'eq' else dict.fromkeys(value)
+                    plans.append((len(ids), (objs[i] for i in ids
+                                             if i in objs)))
+                elif attr in indexes and op in ('eq', 'in'):
+                    buckets = indexes[attr][0]
+                    keys = [value] if op == 'eq' else dict.fromkeys(value)
+                    found = [buckets[k] for k in keys if k in buckets]
+                    plans.append((sum(map(len, found)),
+                                  (o for b in found for o in b.values())))
+                elif attr in sorted_indexes and op != 'in':
+                    # intersect the slices of all conditions on attr
+                    low, high = sorted_bounds(sorted_indexes[attr][0],
+                                              op, value)
+                    old_low, old_high = ranges.get(attr, (low, high))
+                    ranges[attr] = (max(low, old_low), min(high, old_high))
+            except TypeError:
+                # unhashable or incomparable value: left to the scan
+                continue
+        for attr, (low, high) in ranges.items():
+            ids = sorted_indexes[attr][1]
+            plans.append((max(high - low, 0),
+                          map(objs.__getitem__,
+                              map(ids.__getitem__, range(low, high)))))
+        if not plans:
+            return None
+        return min(plans, key=lambda plan: plan[0])[1]
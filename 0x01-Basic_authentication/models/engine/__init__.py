@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+""" Storage backends of models.Base, chosen by BASE_STORAGE_BACKEND:
+"file" (default) for JSON files, "sqlite" for a SQLite database
+"""
+from os import getenv
+
+from models.engine.storage import Storage
+
+
+def get_storage() -> Storage:
+    """ Return a new instance of the configured storage backend
+    """
+    backend = getenv("BASE_STORAGE_BACKEND", "file")
+    if backend == "sqlite":
+        from models.engine.sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    if backend != "file":
+        raise ValueError("unknown storage backend {}".format(backend))
+    from models.engine.file_storage import FileStorage
+    return FileStorage()
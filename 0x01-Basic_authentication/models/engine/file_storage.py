@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+""" FileStorage module: one JSON file per class
+
+Each class is snapshotted in .db_<class>.json (mirrored in a binary
+.db_<class>.bin), either rewritten on every mutation or completed by an
+append-only journal (.db_<class>.journal) compacted in the background.
+"""
+from contextlib import contextmanager
+from os import getenv, path
+from typing import Callable, Iterator, List, TypeVar
+import atexit
+import gc
+import json
+import marshal
+import os
+import signal
+import tempfile
+import threading
+import time
+
+from models import base
+from models.engine.storage import MULTIPROCESS, SYNC_INTERVAL, Storage
+
+
+# "file" rewrites .db_<class>.json on every mutation, "journal" appends
+# one record per mutation to .db_<class>.journal and compacts it into
+# .db_<class>.json in the background past JOURNAL_MAX_BYTES
+STORAGE_MODE = getenv("BASE_STORAGE_MODE", "file")
+JOURNAL_MAX_BYTES = int(getenv("BASE_JOURNAL_MAX_BYTES", 4 * 1024 * 1024))
+# write-behind: mutations only mark their class dirty and a background
+# thread persists them every FLUSH_INTERVAL seconds, or as soon as
+# MAX_PENDING mutations are waiting; save(durable=True) writes at once
+WRITE_BEHIND = getenv("BASE_WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL = float(getenv("BASE_FLUSH_INTERVAL", "1.0"))
+MAX_PENDING = int(getenv("BASE_MAX_PENDING", "1000"))
+# in multi-process mode writes hold an flock() on .db_<class>.lock and
+# each process replays what the others appended to the journal
+if MULTIPROCESS:
+    STORAGE_MODE = "journal"
+# layout version of the .db_<class>.bin companion of snapshots
+SNAPSHOT_VERSION = 1
+# umask of the process, read once: os.umask() can only read it by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def atomic_write(file_path: str, content: bytes):
+    """ Write `content` to a temporary file, then rename it over
+    `file_path` so readers and crashes only ever see a complete file
+    The file keeps the mode of the one it replaces, or gets the mode
+    open() would give a new one
+    """
+    try:
+        mode = os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=path.basename(file_path) + ".", suffix=".tmp",
+        dir=path.dirname(path.abspath(file_path)))
+    try:
+        # mkstemp() creates the file readable by its owner only
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def binary_snapshot_path(file_path: str) -> str:
+    """ Path of the binary companion of a .json snapshot
+    """
+    return path.splitext(file_path)[0] + ".bin"
+
+
+def write_snapshot(file_path: str, objs_json: dict):
+    """ Write a JSON snapshot, then its binary companion
+
+    The binary file holds the same objects as columns marshalled in one
+    blob, stamped with the size and mtime of the JSON file it mirrors so a
+    stale or orphan companion is ignored by read_binary_snapshot()
+    """
+    atomic_write(file_path, json.dumps(objs_json).encode())
+    fields = {}
+    for obj_json in objs_json.values():
+        for key in obj_json:
+            fields[key] = None
+    fields = tuple(fields)
+    columns = [[obj_json.get(key) for obj_json in objs_json.values()]
+               for key in fields]
+    stat = os.stat(file_path)
+    atomic_write(binary_snapshot_path(file_path), marshal.dumps(
+        (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime_ns, fields, columns)))
+
+
+def read_binary_snapshot(file_path: str):
+    """ Return (fields, columns) of the binary companion of `file_path`,
+    None when it is missing or does not match the JSON file
+    """
+    try:
+        stat = os.stat(file_path)
+        with open(binary_snapshot_path(file_path), 'rb') as f:
+            # marshal.load() on a file object reads piecemeal, far slower
+            version, size, mtime_ns, fields, columns = marshal.loads(
+                f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if (version, size, mtime_ns) != \
+            (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime_ns):
+        return None
+    return fields, columns
+
+
+def file_stamp(file_path: str):
+    """ (inode, mtime, size) of a file, None if it doesn't exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class Journal():
+    """ Append-only log of the mutations of one class since its last
+    snapshot (.db_<class>.json)
+
+    Each line is a JSON record {"op": "save", "id": ..., "obj": {...}} or
+    {"op": "remove", "id": ...}. Replaying records in order on top of the
+    snapshot rebuilds the data; a torn last line is skipped on replay.
+    Compaction renames the journal to .old, writes a fresh snapshot and
+    then deletes the .old file.
+
+    The journal remembers how far it has read the file and which snapshot
+    it was loaded from, so that in multi-process mode the records appended
+    by other processes can be replayed incrementally.
+    """
+
+    def __init__(self, s_class: str):
+        """ Initialize the journal of class name `s_class`
+        """
+        self.snapshot_path = ".db_{}.json".format(s_class)
+        self.path = ".db_{}.journal".format(s_class)
+        self.old_path = self.path + ".old"
+        self.lock_path = ".db_{}.lock".format(s_class)
+        # held while appending or rotating the journal file
+        self.lock = threading.RLock()
+        # held while a snapshot is computed and written
+        self.snapshot_lock = threading.Lock()
+        self.compacting = False
+        # records of write-behind mutations not written yet
+        self.pending = []
+        self._file = None
+        # what this process has seen of the files
+        self.snapshot_stamp = None
+        self.inode = None
+        self.offset = 0
+        self.next_sync = 0.0
+        # inter-process lock: a thread lock around an flock()
+        self._process_mutex = threading.RLock()
+        self._process_depth = 0
+        self._lock_file = None
+
+    @contextmanager
+    def process_lock(self) -> Iterator[None]:
+        """ Hold the class files exclusively across processes for the
+        `with` block (a no-op unless MULTIPROCESS)
+        """
+        if not MULTIPROCESS:
+            yield
+            return
+        import fcntl
+        with self._process_mutex:
+            if self._process_depth == 0:
+                if self._lock_file is None:
+                    self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._process_depth += 1
+            try:
+                yield
+            finally:
+                self._process_depth -= 1
+                if self._process_depth == 0:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def buffer(self, record: dict):
+        """ Queue one record until the next append()
+        """
+        with self.lock:
+            self.pending.append(record)
+
+    def append(self, *records: dict) -> int:
+        """ Append the pending records then `records` in one write and
+        return the journal size in bytes
+        The read offset moves to the end of the file, so in multi-process
+        mode the caller holds process_lock() and replayed the journal
+        """
+        with self.lock:
+            records = self.pending + list(records)
+            self.pending = []
+            if self._file is not None and MULTIPROCESS:
+                # another process may have rotated the journal
+                stamp = file_stamp(self.path)
+                if stamp is None or \
+                        stamp[0] != os.fstat(self._file.fileno()).st_ino:
+                    self.close()
+            if not records and self._file is None:
+                return path.getsize(self.path) \
+                    if path.exists(self.path) else 0
+            lines = "".join(json.dumps(r) + "\n" for r in records)
+            if self._file is None:
+                self._file = open(self.path, 'a+')
+                # never glue a record to a torn line left by a crash
+                if self._file.tell() > 0:
+                    self._file.seek(self._file.tell() - 1)
+                    if self._file.read(1) != "\n":
+                        self._file.write("\n")
+            self._file.write(lines)
+            self._file.flush()
+            self.inode = os.fstat(self._file.fileno()).st_ino
+            self.offset = self._file.tell()
+            return self.offset
+
+    def begin_compaction(self) -> bool:
+        """ Claim the right to run the next compaction
+        """
+        with self.lock:
+            if self.compacting:
+                return False
+            self.compacting = True
+            return True
+
+    def close(self):
+        """ Close the journal file
+        """
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def rotate(self) -> bool:
+        """ Move the journal aside before compaction, unless a previous
+        compaction still owns the .old file
+        """
+        with self.lock:
+            if path.exists(self.old_path) or not path.exists(self.path):
+                return False
+            self.close()
+            os.replace(self.path, self.old_path)
+            self.inode = None
+            self.offset = 0
+            return True
+
+    @staticmethod
+    def _parse(data: bytes) -> List[dict]:
+        """ Records of complete journal lines
+        """
+        records = []
+        for line in data.splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def read_old(self) -> List[dict]:
+        """ Records of the .old journal left by a running or interrupted
+        compaction
+        """
+        try:
+            with open(self.old_path, 'rb') as f:
+                return self._parse(f.read())
+        except FileNotFoundError:
+            return []
+
+    def read_new(self) -> List[dict]:
+        """ Records of the current journal not read yet, up to the last
+        complete line
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.inode, self.offset = None, 0
+            return []
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self.inode:
+                self.inode, self.offset = inode, 0
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return self._parse(data[:end])
+
+    def changed(self) -> bool:
+        """ Whether the files changed since this process last read them
+        """
+        if file_stamp(self.snapshot_path) != self.snapshot_stamp:
+            return True
+        stamp = file_stamp(self.path)
+        if stamp is None:
+            return self.inode is not None
+        return (stamp[0], stamp[2]) != (self.inode, self.offset)
+
+
+JOURNALS = {}
+
+
+def get_journal(s_class: str) -> Journal:
+    """ Return the journal of class name `s_class`
+    """
+    journal = JOURNALS.get(s_class)
+    if journal is None:
+        journal = JOURNALS.setdefault(s_class, Journal(s_class))
+    return journal
+
+
+class Flusher():
+    """ Background writer of the classes marked dirty in write-behind mode
+    """
+
+    def __init__(self, flush_class: Callable[[type], None]):
+        """ Initialize a flusher writing a class with `flush_class`; its
+        thread starts on the first mark()
+        """
+        self.flush_class = flush_class
+        self.dirty = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def mark(self, cls) -> bool:
+        """ Mark `cls` dirty, return True once MAX_PENDING mutations wait
+        """
+        with self._lock:
+            pending = self.dirty.get(cls, 0) + 1
+            self.dirty[cls] = pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+        return pending >= MAX_PENDING
+
+    def flush(self, base=None):
+        """ Persist every dirty class (or only subclasses of `base`)
+        """
+        with self._lock:
+            classes = [cls for cls in self.dirty
+                       if base is None or issubclass(cls, base)]
+            for cls in classes:
+                del self.dirty[cls]
+        for cls in classes:
+            self.flush_class(cls)
+
+    def _run(self):
+        """ Flush dirty classes every FLUSH_INTERVAL seconds
+        """
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                # keep flushing, the next mutation marks the class again
+                pass
+
+
+def exit_on_signal(signum: int, frame):
+    """ Signal handler exiting like sys.exit(), so atexit handlers run
+    """
+    raise SystemExit(128 + signum)
+
+
+class FileStorage(Storage):
+    """ Storage of each class in .db_<class>.json, following STORAGE_MODE,
+    WRITE_BEHIND and MULTIPROCESS
+
+    In multi-process mode the journal files are guarded by an flock() on
+    .db_<class>.lock, always taken after STORE_LOCK.
+    """
+
+    def __init__(self):
+        """ Initialize the storage and its write-behind flusher
+        """
+        self.flusher = Flusher(self._flush_pending)
+        atexit.register(self.flusher.flush)
+        # the default SIGTERM action kills the process without running
+        # atexit: pending changes would be lost on a plain `kill`
+        if WRITE_BEHIND and \
+                threading.current_thread() is threading.main_thread() and \
+                signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, exit_on_signal)
+
+    def load(self, cls: type):
+        """ Load all objects of `cls` from its files
+        """
+        self._load(cls)
+        # a leftover .old journal means a compaction was interrupted
+        if STORAGE_MODE == "journal" and \
+                path.exists(get_journal(cls.__name__).old_path):
+            self.save_all(cls, durable=True)
+
+    def _load(self, cls: type):
+        """ Replace the objects of `cls` in memory by those in the files
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal = get_journal(s_class)
+        build = cls._loader()
+        objs = {}
+        # millions of new objects would otherwise trigger many useless
+        # collections while loading
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with base.STORE_LOCK.write(), journal.process_lock():
+                journal.snapshot_stamp = file_stamp(file_path)
+                binary = read_binary_snapshot(file_path)
+                if binary is not None:
+                    for obj in cls._from_columns(*binary):
+                        objs[obj.id] = obj
+                elif path.exists(file_path):
+                    with open(file_path, 'r') as f:
+                        objs_json = json.load(f)
+                        for obj_id, obj_json in objs_json.items():
+                            objs[obj_id] = build(obj_json)
+
+                if STORAGE_MODE == "journal":
+                    journal.inode, journal.offset = None, 0
+                    # write-behind records not written yet come last, as
+                    # they will in the journal
+                    for record in journal.read_old() + journal.read_new() \
+                            + list(journal.pending):
+                        if record.get("op") == "save":
+                            objs[record["id"]] = build(record["obj"])
+                        elif record.get("op") == "remove":
+                            objs.pop(record["id"], None)
+                base.DATA[s_class] = objs
+                cls.rebuild_indexes()
+                journal.next_sync = time.monotonic() + SYNC_INTERVAL
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def sync(self, cls: type, force: bool = False):
+        """ In multi-process mode, replay the journal records appended by
+        other processes, or reload everything after one of them compacted.
+        Unless `force` is set the files are checked at most every
+        SYNC_INTERVAL seconds
+        """
+        if not MULTIPROCESS:
+            return
+        journal = get_journal(cls.__name__)
+        now = time.monotonic()
+        if not force:
+            if now < journal.next_sync:
+                return
+            journal.next_sync = now + SYNC_INTERVAL
+            if not journal.changed():
+                return
+        with base.STORE_LOCK.write(), journal.process_lock():
+            if file_stamp(journal.snapshot_path) != journal.snapshot_stamp:
+                self._load(cls)
+                return
+            build = cls._loader()
+            # objects with write-behind records not written yet keep their
+            # state: those records will follow these in the journal
+            pending = {record["id"] for record in journal.pending}
+            for record in journal.read_new():
+                if record.get("id") in pending:
+                    continue
+                if record.get("op") == "save":
+                    build(record["obj"])._store()
+                elif record.get("op") == "remove":
+                    obj = base.DATA[cls.__name__].get(record["id"])
+                    if obj is not None:
+                        obj._unstore()
+
+    def lock(self, cls: type):
+        """ Hold the files of `cls` across processes in multi-process mode
+        """
+        return get_journal(cls.__name__).process_lock()
+
+    def save_all(self, cls: type, durable: bool = False):
+        """ Save all objects of `cls` to its file
+        In write-behind mode the class is only marked dirty unless
+        `durable` is set
+        """
+        if WRITE_BEHIND and not durable:
+            if self.flusher.mark(cls):
+                self.flusher.flush(cls)
+            return
+
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        if STORAGE_MODE == "journal":
+            self.compact(cls, force=True)
+            return
+
+        # concurrent holders of the shared lock see the same data, so
+        # whichever snapshot lands last is up to date
+        with base.STORE_LOCK.read():
+            write_snapshot(file_path, cls._snapshot())
+
+    def compact(self, cls: type, force: bool = False):
+        """ Fold the journal of `cls` into a new snapshot; unless `force`
+        is set this is skipped when there is no journal to fold
+        """
+        journal = get_journal(cls.__name__)
+        lock = base.STORE_LOCK
+        # other processes must not append between the catch-up and the
+        # rotation, so the store is held exclusively in multi-process mode
+        acquire, release = (lock.acquire_write, lock.release_write) \
+            if MULTIPROCESS else (lock.acquire_read, lock.release_read)
+        try:
+            with journal.snapshot_lock:
+                acquire()
+                held = True
+                try:
+                    with journal.process_lock():
+                        self.sync(cls, force=True)
+                        if not journal.rotate() and not force:
+                            return
+                        # records appended from now on go to a fresh
+                        # journal; replaying them over a snapshot taken
+                        # later is harmless as each carries the full object
+                        objs_json = cls._snapshot()
+                        release()
+                        held = False
+                        write_snapshot(journal.snapshot_path, objs_json)
+                        journal.snapshot_stamp = \
+                            file_stamp(journal.snapshot_path)
+                        if path.exists(journal.old_path):
+                            os.unlink(journal.old_path)
+                finally:
+                    if held:
+                        release()
+        finally:
+            journal.compacting = False
+
+    def flush(self, cls: type):
+        """ Persist the pending write-behind mutations of `cls` and its
+        subclasses
+        """
+        self.flusher.flush(cls)
+
+    def _flush_pending(self, cls: type):
+        """ Write what write-behind mode left pending for `cls`
+        In multi-process mode the records of the other processes are
+        replayed first: appending moves past them in the journal
+        """
+        if STORAGE_MODE != "journal":
+            self.save_all(cls, durable=True)
+        elif not MULTIPROCESS:
+            self._append_journal(cls)
+        else:
+            with base.STORE_LOCK.write(), self.lock(cls):
+                self.sync(cls, force=True)
+                self._append_journal(cls)
+
+    def _append_journal(self, cls: type, *records: dict):
+        """ Append `records` to the journal, compacting it when too big
+        """
+        journal = get_journal(cls.__name__)
+        if journal.append(*records) > JOURNAL_MAX_BYTES \
+                and journal.begin_compaction():
+            threading.Thread(target=self.compact, args=(cls,),
+                             daemon=True).start()
+
+    def persist(self, obj: TypeVar('Base'), op: str,
+                durable: bool = False):
+        """ Persist one mutation of `obj`
+        """
+        cls = obj.__class__
+        if STORAGE_MODE != "journal":
+            self.save_all(cls, durable)
+            return
+
+        record = {"op": op, "id": obj.id}
+        if op == "save":
+            record["obj"] = obj.to_json(True)
+        if WRITE_BEHIND and not durable:
+            get_journal(cls.__name__).buffer(record)
+            if self.flusher.mark(cls):
+                self.flusher.flush(cls)
+            return
+        self._append_journal(cls, record)
+
+    def persist_many(self, cls: type, objs: List[TypeVar('Base')],
+                     durable: bool = False):
+        """ Persist the saving of `objs` with one write
+        """
+        if STORAGE_MODE != "journal":
+            self.save_all(cls, durable)
+            return
+
+        records = [{"op": "save", "id": obj.id, "obj": obj.to_json(True)}
+                   for obj in objs]
+        if WRITE_BEHIND and not durable:
+            journal = get_journal(cls.__name__)
+            for record in records:
+                journal.buffer(record)
+            if self.flusher.mark(cls):
+                self.flusher.flush(cls)
+            return
+        self._append_journal(cls, *records)
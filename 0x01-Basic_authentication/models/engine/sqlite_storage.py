@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+""" SQLiteStorage module: one SQLite database, one table per class
+"""
+from os import getenv
+from typing import List, Optional, TypeVar
+import gc
+import json
+import sqlite3
+import threading
+import time
+
+from models import base
+from models.engine.storage import MULTIPROCESS, SYNC_INTERVAL, Storage
+
+
+# entries kept in the change log of each class: a process that fell
+# further behind reloads the whole class
+CHANGES_KEPT = int(getenv("BASE_SQLITE_CHANGES_KEPT", "10000"))
+# ids looked up by one query while catching up
+LOOKUP_SIZE = 500
+
+
+class SQLiteStorage(Storage):
+    """ Storage of each class in a table of the database at
+    BASE_SQLITE_PATH, with one column per serialized attribute and an
+    index on each indexed attribute
+
+    Every mutation is committed on its own, with an entry naming the
+    changed id in the change log of the class ("<class>__changes"); searches
+    on attributes the memory indexes don't cover are answered by SQL. In
+    multi-process mode the rows logged since the last sync are reloaded
+    once another connection changed the database, or the whole class when
+    the log doesn't go back that far. Lists and dicts, which have no SQL
+    type, are stored as JSON in BLOBs.
+    """
+
+    def __init__(self, db_path: str = None):
+        """ Initialize a storage in `db_path`, opened on first use
+        """
+        self.db_path = db_path or getenv("BASE_SQLITE_PATH", ".db.sqlite3")
+        # the connection is shared by all threads and used under this lock
+        self._lock = threading.RLock()
+        self._conn = None
+        self._tables = set()
+        # class name -> PRAGMA data_version seen at the last load or sync
+        self._versions = {}
+        # class name -> last change log entry read
+        self._seqs = {}
+        self._next_sync = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the connection, opening it on first use
+        """
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def _table(self, cls: type) -> str:
+        """ Create the table of `cls` and its indexes if needed, return
+        its quoted name
+        """
+        s_class = cls.__name__
+        table = '"{}"'.format(s_class)
+        if s_class in self._tables:
+            return table
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS {} '
+                     '(id TEXT PRIMARY KEY)'.format(table))
+        conn.execute('CREATE TABLE IF NOT EXISTS {} (seq INTEGER PRIMARY '
+                     'KEY AUTOINCREMENT, id TEXT)'.format(self._changes(cls)))
+        columns = [row[1] for row in conn.execute(
+            'PRAGMA table_info({})'.format(table))]
+        for key in cls.ATTRIBUTES:
+            if key not in columns:
+                conn.execute('ALTER TABLE {} ADD COLUMN "{}"'.format(
+                    table, key))
+        for attr in cls.INDEXED_ATTRIBUTES:
+            conn.execute('CREATE INDEX IF NOT EXISTS "ix_{}_{}" '
+                         'ON {} ("{}")'.format(s_class, attr, table, attr))
+        self._tables.add(s_class)
+        return table
+
+    @staticmethod
+    def _changes(cls: type) -> str:
+        """ Quoted name of the change log table of `cls`
+        """
+        return '"{}__changes"'.format(cls.__name__)
+
+    def _log(self, conn: sqlite3.Connection, cls: type,
+             ids: List[Optional[str]]):
+        """ Log the change of the rows of `ids` (None for all of them) in
+        the running transaction, dropping entries past CHANGES_KEPT
+        """
+        changes = self._changes(cls)
+        conn.executemany('INSERT INTO {} (id) VALUES (?)'.format(changes),
+                         [(obj_id,) for obj_id in ids])
+        conn.execute('DELETE FROM {0} WHERE seq <= (SELECT MAX(seq) FROM {0})'
+                     ' - ?'.format(changes), (CHANGES_KEPT,))
+
+    def _insert(self, cls: type) -> str:
+        """ Statement upserting one row of `cls`
+        """
+        keys = cls.ATTRIBUTES
+        return 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+            self._table(cls), ", ".join('"{}"'.format(k) for k in keys),
+            ", ".join("?" * len(keys)))
+
+    @staticmethod
+    def _row(obj: TypeVar('Base')) -> tuple:
+        """ Column values of `obj`, in ATTRIBUTES order
+        """
+        obj_json = obj.to_json(True)
+        row = tuple(obj_json.get(key) for key in obj.ATTRIBUTES)
+        if any(type(value) in (list, dict) for value in row):
+            row = tuple(json.dumps(value).encode()
+                        if type(value) in (list, dict) else value
+                        for value in row)
+        return row
+
+    @staticmethod
+    def _column(values: tuple) -> list:
+        """ Values of one column, or row, as stored by _row()
+        """
+        return [json.loads(value) if type(value) is bytes else value
+                for value in values]
+
+    def _select(self, cls: type) -> str:
+        """ Statement selecting the rows of `cls`, ATTRIBUTES in order
+        """
+        return 'SELECT {} FROM {}'.format(
+            ", ".join('"{}"'.format(k) for k in cls.ATTRIBUTES),
+            self._table(cls))
+
+    def load(self, cls: type):
+        """ Load all objects of `cls` from its table
+        """
+        s_class = cls.__name__
+        keys = cls.ATTRIBUTES
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with base.STORE_LOCK.write(), self._lock:
+                conn = self._connection()
+                self._table(cls)
+                # read first: a change committed after it reloads again
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                # one read transaction: the rows match the last entry
+                conn.execute("BEGIN")
+                try:
+                    seq = conn.execute('SELECT MAX(seq) FROM {}'.format(
+                        self._changes(cls))).fetchone()[0] or 0
+                    rows = conn.execute(self._select(cls)).fetchall()
+                finally:
+                    conn.execute("COMMIT")
+                columns = [self._column(c) for c in zip(*rows)] or \
+                    [[] for _ in keys]
+                base.DATA[s_class] = {
+                    obj.id: obj for obj in cls._from_columns(keys, columns)}
+                cls.rebuild_indexes()
+                self._versions[s_class] = version
+                self._seqs[s_class] = seq
+                self._next_sync[s_class] = time.monotonic() + SYNC_INTERVAL
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def sync(self, cls: type, force: bool = False):
+        """ In multi-process mode, reload the rows of `cls` changed by
+        other connections, at most every SYNC_INTERVAL seconds. Rows are
+        written independently so `force` doesn't make a write wait
+        """
+        if not MULTIPROCESS:
+            return
+        s_class = cls.__name__
+        now = time.monotonic()
+        if now < self._next_sync.get(s_class, 0.0):
+            return
+        self._next_sync[s_class] = now + SYNC_INTERVAL
+        with self._lock:
+            version = self._connection().execute(
+                "PRAGMA data_version").fetchone()[0]
+        if version != self._versions.get(s_class):
+            self._catch_up(cls)
+
+    def _catch_up(self, cls: type):
+        """ Reload the rows of `cls` named by the change log entries not
+        read yet, or the whole class if they are no longer all there
+        """
+        s_class = cls.__name__
+        keys = cls.ATTRIBUTES
+        with base.STORE_LOCK.write(), self._lock:
+            conn = self._connection()
+            changes = self._changes(cls)
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            last = self._seqs.get(s_class, 0)
+            conn.execute("BEGIN")
+            try:
+                oldest = conn.execute('SELECT MIN(seq) FROM {}'.format(
+                    changes)).fetchone()[0]
+                entries = conn.execute(
+                    'SELECT seq, id FROM {} WHERE seq > ? ORDER BY seq'
+                    .format(changes), (last,)).fetchall()
+                ids = list(dict.fromkeys(obj_id for _, obj_id in entries))
+                reload = oldest is not None and oldest > last + 1 or \
+                    None in ids
+                rows = []
+                if not reload:
+                    select = self._select(cls)
+                    for i in range(0, len(ids), LOOKUP_SIZE):
+                        chunk = ids[i:i + LOOKUP_SIZE]
+                        rows += conn.execute('{} WHERE id IN ({})'.format(
+                            select, ", ".join("?" * len(chunk))),
+                            chunk).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            if reload:
+                self.load(cls)
+                return
+            objs = base.DATA[s_class]
+            build = cls._loader()
+            position = keys.index('id')
+            found = {row[position]: row for row in rows}
+            for obj_id in ids:
+                row = found.get(obj_id)
+                obj = objs.get(obj_id)
+                if row is None:
+                    if obj is not None:
+                        obj._unstore()
+                elif obj is None or self._row(obj) != row:
+                    # rows this process wrote itself are left alone
+                    build(dict(zip(keys, self._column(row))))._store()
+            if entries:
+                self._seqs[s_class] = entries[-1][0]
+            self._versions[s_class] = version
+
+    def persist(self, obj: TypeVar('Base'), op: str,
+                durable: bool = False):
+        """ Commit one mutation of `obj`
+        """
+        cls = obj.__class__
+        with self._lock:
+            conn = self._connection()
+            if durable:
+                conn.execute("PRAGMA synchronous=FULL")
+            try:
+                conn.execute("BEGIN")
+                try:
+                    if op == "save":
+                        conn.execute(self._insert(cls), self._row(obj))
+                    else:
+                        conn.execute('DELETE FROM {} WHERE id = ?'.format(
+                            self._table(cls)), (obj.id,))
+                    self._log(conn, cls, [obj.id])
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+
+    def persist_many(self, cls: type, objs: List[TypeVar('Base')],
+                     durable: bool = False):
+        """ Commit the saving of `objs` in one transaction
+        """
+        with self._lock:
+            conn = self._connection()
+            statement = self._insert(cls)
+            if durable:
+                conn.execute("PRAGMA synchronous=FULL")
+            try:
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(statement, map(self._row, objs))
+                    self._log(conn, cls, [obj.id for obj in objs])
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+
+    def save_all(self, cls: type, durable: bool = False):
+        """ Replace the rows of `cls` by the objects in memory, in one
+        transaction
+        """
+        with base.STORE_LOCK.read(), self._lock:
+            conn = self._connection()
+            table = self._table(cls)
+            rows = [self._row(obj)
+                    for obj in base.DATA.get(cls.__name__, {}).values()]
+            conn.execute("BEGIN")
+            try:
+                conn.execute('DELETE FROM {}'.format(table))
+                conn.executemany(self._insert(cls), rows)
+                # readers reload the whole class
+                self._log(conn, cls, [None])
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def search_ids(self, cls: type, attributes: dict) -> Optional[List[str]]:
+        """ Ids of the rows of `cls` matching `attributes`, None when an
+        attribute isn't a column or a value has no SQL equivalent
+        """
+        clauses = []
+        for key, value in attributes.items():
+            if key not in cls.ATTRIBUTES or value is not None and \
+                    type(value) not in (str, int, float):
+                return None
+            # IS compares NULL like Python compares None
+            clauses.append('"{}" IS ?'.format(key))
+        if not clauses:
+            return None
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT id FROM {} WHERE {}'.format(
+                    self._table(cls), " AND ".join(clauses)),
+                tuple(attributes.values())).fetchall()
+        return [row[0] for row in rows]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Storage module: the interface of the backends persisting models.Base
+
+The objects of every class stay in memory (models.base.DATA); a backend
+loads them at start, persists each mutation and may answer searches
+itself. Base calls it with STORE_LOCK held exclusively for load, sync and
+persist, shared for search_ids.
+"""
+from contextlib import nullcontext
+from os import getenv
+from typing import ContextManager, List, Optional, TypeVar
+
+
+# multi-process: several processes share the storage and each one catches
+# up with what the others wrote at most SYNC_INTERVAL seconds later
+MULTIPROCESS = getenv("BASE_MULTIPROCESS", "0") == "1"
+SYNC_INTERVAL = float(getenv("BASE_SYNC_INTERVAL", "0.5"))
+
+
+class Storage():
+    """ Storage backend of models.Base
+    """
+
+    def load(self, cls: type):
+        """ Replace the objects of `cls` in memory by the stored ones
+        """
+        raise NotImplementedError
+
+    def sync(self, cls: type, force: bool = False):
+        """ Catch up with what other processes stored for `cls`; unless
+        `force` is set this may be skipped if done recently
+        """
+        pass
+
+    def lock(self, cls: type) -> ContextManager:
+        """ Context manager held around each mutation of `cls`
+        """
+        return nullcontext()
+
+    def persist(self, obj: TypeVar('Base'), op: str,
+                durable: bool = False):
+        """ Store one mutation ("save" or "remove") of `obj`; `durable`
+        asks for the change to be on disk when this returns
+        """
+        raise NotImplementedError
+
+    def persist_many(self, cls: type, objs: List[TypeVar('Base')],
+                     durable: bool = False):
+        """ Store the saving of several objects of `cls` at once
+        """
+        for obj in objs:
+            self.persist(obj, "save", durable)
+
+    def save_all(self, cls: type, durable: bool = False):
+        """ Store every object of `cls` as it is in memory
+        """
+        raise NotImplementedError
+
+    def flush(self, cls: type):
+        """ Store the mutations of `cls` (and its subclasses) that are
+        still pending
+        """
+        pass
+
+    def compact(self, cls: type, force: bool = False):
+        """ Reclaim the space used by past mutations of `cls`
+        """
+        pass
+
+    def search_ids(self, cls: type, attributes: dict) -> Optional[List[str]]:
+        """ Ids of the stored objects of `cls` matching `attributes`, or
+        None when the backend can't answer the query itself
+        """
+        return None
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+""" Password module: hashing and verification of User passwords
+
+New passwords are hashed with bcrypt (PASSWORD_HASH=bcrypt, the default)
+at a cost calibrated on the host, or with the legacy unsalted SHA-256
+(PASSWORD_HASH=sha256). Both kinds of hashes are verified, so users keep
+their legacy hash until it is replaced by needs_rehash() callers.
+
+bcrypt calls run in POOL, a bounded pool of worker threads, so a burst of
+logins can't take more than PASSWORD_WORKERS cores.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from os import getenv
+from typing import Callable, Iterable, List
+import hashlib
+import hmac
+import math
+import os
+import threading
+import time
+
+
+SCHEME = getenv("PASSWORD_HASH", "bcrypt")
+# bcrypt cost: PASSWORD_BCRYPT_ROUNDS, or calibrated so that one hash
+# takes about PASSWORD_TARGET_MS milliseconds on this host
+BCRYPT_ROUNDS = getenv("PASSWORD_BCRYPT_ROUNDS")
+TARGET_MS = float(getenv("PASSWORD_TARGET_MS", "100"))
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+def calibrate_rounds(target: float, probe: int = 8) -> int:
+    """ Return the bcrypt cost closest to `target` seconds per hash on
+    this host: each extra round doubles the time of one measured at cost
+    `probe`
+    """
+    import bcrypt
+
+    salt = bcrypt.gensalt(probe)
+    elapsed = None
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        took = time.perf_counter() - start
+        elapsed = took if elapsed is None else min(elapsed, took)
+    rounds = probe + round(math.log2(target / max(elapsed, 1e-6)))
+    return max(BCRYPT_MIN_ROUNDS, min(rounds, BCRYPT_MAX_ROUNDS))
+
+
+@lru_cache(maxsize=1)
+def bcrypt_rounds() -> int:
+    """ bcrypt cost of new hashes, calibrated on first use unless set
+    """
+    if BCRYPT_ROUNDS:
+        return int(BCRYPT_ROUNDS)
+    return calibrate_rounds(TARGET_MS / 1000)
+
+
+class PasswordPool():
+    """ Bounded pool of threads running the bcrypt calls
+
+    At most `workers` calls run at once and at most `queue_size` more
+    wait; a caller finding no room for `timeout` seconds gets a
+    TimeoutError. With 0 workers calls run in the calling thread.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        """ Initialize a pool; its threads start on demand
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password") \
+            if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    @classmethod
+    def from_env(cls) -> 'PasswordPool':
+        """ Pool of PASSWORD_WORKERS threads (number of CPUs by default)
+        with PASSWORD_QUEUE waiting calls (4 per worker by default)
+        """
+        workers = int(getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+        queue_size = int(getenv("PASSWORD_QUEUE", str(4 * max(workers, 1))))
+        return cls(workers, queue_size,
+                   float(getenv("PASSWORD_TIMEOUT", "5")))
+
+    def _submit(self, func: Callable, *args) -> Future:
+        """ Queue func(*args) once there is room for it
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise TimeoutError("password pool is full")
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, func: Callable, *args):
+        """ Run func(*args) in the pool and return its result
+        """
+        if self._executor is None:
+            return func(*args)
+        return self._submit(func, *args).result()
+
+    def map(self, func: Callable, args_list: Iterable[tuple]) -> list:
+        """ Run func(*args) for each args in the pool, in parallel, and
+        return the results in order. At most one call per worker is in
+        flight, so the queue keeps room for other callers
+        """
+        if self._executor is None:
+            return [func(*args) for args in args_list]
+        results = []
+        window = deque()
+        for args in args_list:
+            if len(window) >= self.workers:
+                results.append(window.popleft().result())
+            window.append(self._submit(func, *args))
+        results.extend(future.result() for future in window)
+        return results
+
+
+POOL = PasswordPool.from_env()
+
+
+def is_bcrypt(hashed: str) -> bool:
+    """ Whether `hashed` is a bcrypt hash
+    """
+    return hashed.startswith("$2")
+
+
+def sha256(pwd: str) -> str:
+    """ Legacy hash: unsalted SHA-256 hex digest
+    """
+    return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+
+def _bcrypt_hash(pwd: str, rounds: int) -> str:
+    """ bcrypt hash of `pwd` at cost `rounds`
+    """
+    import bcrypt
+
+    return bcrypt.hashpw(pwd.encode()[:BCRYPT_MAX_BYTES],
+                         bcrypt.gensalt(rounds)).decode()
+
+
+def _bcrypt_check(hashed: str, pwd: str) -> bool:
+    """ Whether `pwd` matches the bcrypt hash `hashed`
+    """
+    import bcrypt
+
+    try:
+        return bcrypt.checkpw(pwd.encode()[:BCRYPT_MAX_BYTES],
+                              hashed.encode())
+    except ValueError:
+        return False
+
+
+def hash_password(pwd: str) -> str:
+    """ Hash a new password with SCHEME
+    """
+    if SCHEME == "sha256":
+        return sha256(pwd)
+    return POOL.run(_bcrypt_hash, pwd, bcrypt_rounds())
+
+
+def hash_passwords(pwds: List[str]) -> List[str]:
+    """ Hash new passwords with SCHEME, in parallel
+    """
+    if SCHEME == "sha256":
+        return [sha256(pwd) for pwd in pwds]
+    rounds = bcrypt_rounds()
+    return POOL.map(_bcrypt_hash, [(pwd, rounds) for pwd in pwds])
+
+
+def verify_password(hashed: str, pwd: str) -> bool:
+    """ Whether `pwd` matches `hashed`, a bcrypt or legacy hash; raises
+    TimeoutError when the pool has no room for the check
+    """
+    if not is_bcrypt(hashed):
+        return hmac.compare_digest(sha256(pwd).encode(), hashed.encode())
+    return POOL.run(_bcrypt_check, hashed, pwd)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """ Whether `hashed` should be replaced by a hash of SCHEME, i.e. is
+    a legacy hash or a bcrypt hash of a lower cost
+    """
+    if SCHEME == "sha256":
+        return False
+    if not is_bcrypt(hashed):
+        return True
+    try:
+        return int(hashed.split("$")[2]) < bcrypt_rounds()
+    except (IndexError, ValueError):
+        return True
@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from datetime import datetime
+
+from models import base
 from models.base import Base
+from models.password import hash_password, needs_rehash, verify_password
 
 
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password_hash', 'first_name', 'last_name')
+    ATTRIBUTES = Base.ATTRIBUTES + \
+        ('email', '_password', 'first_name', 'last_name')
+    INDEXED_ATTRIBUTES = ("email",)
+    SORTED_ATTRIBUTES = {"email": str, "created_at": datetime}
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -18,6 +27,29 @@ class User(Base):
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
 
+    @property
+    def _password(self) -> str:
+        """ Getter of the stored password hash
+        """
+        value = self._password_hash
+        if type(value) is bytes:
+            return value.hex()
+        return value
+
+    @_password.setter
+    def _password(self, value: str):
+        """ Setter of the stored password hash: SHA256 hex digests are
+        kept as raw bytes in compact mode
+        """
+        if base.COMPACT_MODELS and type(value) is str and len(value) == 64:
+            try:
+                raw = bytes.fromhex(value)
+            except ValueError:
+                raw = None
+            if raw is not None and raw.hex() == value:
+                value = raw
+        self._password_hash = value
+
     @property
     def password(self) -> str:
         """ Getter of the password
@@ -26,22 +58,29 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash it with bcrypt, see
+        models.password
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hash_password(pwd)
 
     def is_valid_password(self, pwd: str) -> bool:
-        """ Validate a password
+        """ Validate a password; raises TimeoutError when it can't be
+        checked for now
         """
         if pwd is None or type(pwd) is not str:
             return False
         if self.password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        return verify_password(self.password, pwd)
+
+    def password_needs_rehash(self) -> bool:
+        """ Whether the stored hash is a legacy SHA256 one or weaker than
+        new hashes, to replace after a successful login
+        """
+        return self.password is not None and needs_rehash(self.password)
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+""" Tests of the in-memory store of models.base
+"""
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+
+from models import base
+from models.user import User
+
+
+CWD = os.getcwd()
+# backends keep their files open: every test runs in the same directory
+DIRECTORY = tempfile.TemporaryDirectory()
+
+
+def setUpModule():
+    """ Run in a temporary directory
+    """
+    os.chdir(DIRECTORY.name)
+
+
+def tearDownModule():
+    """ Go back to the initial directory
+    """
+    os.chdir(CWD)
+    DIRECTORY.cleanup()
+
+
+class TestIndexes(unittest.TestCase):
+    """ Objects with values the indexes can't hold
+    """
+
+    def setUp(self):
+        """ Start from an empty store
+        """
+        User.load_from_file()
+        for user in User.all():
+            user.remove()
+        self.users = [User(email="user{}@example.com".format(i))
+                      for i in range(5)]
+        User.save_many(self.users)
+
+    def emails(self, attributes: dict) -> list:
+        """ Emails of the users found by search(attributes)
+        """
+        return sorted(map(str, (u.email for u in User.search(attributes))))
+
+    def test_incomparable_value_saved(self):
+        """ A value the sorted index can't order is stored, and found
+        """
+        user = User(email=5)
+        user.save()
+        self.assertIs(User.get(user.id), user)
+        self.assertEqual(User.count(), 6)
+        self.assertEqual(User.search({"email": 5}), [user])
+        self.assertEqual(User.search({"email__in": [5]}), [user])
+        self.assertEqual(len(User.search({"email__gte": "user"})), 5)
+        self.assertEqual(len(User.search({"email__prefix": "user"})), 5)
+
+    def test_incomparable_value_reloaded(self):
+        """ The files hold the object, and the indexes rebuilt from them
+        leave the value out
+        """
+        User(email=5).save()
+        User.flush()
+        User.load_from_file()
+        self.assertEqual(User.count(), 6)
+        self.assertEqual(self.emails({"email": 5}), ["5"])
+        self.assertEqual(len(User.search({"email__lt": "v"})), 5)
+
+    def test_value_indexed_again(self):
+        """ An object back to an indexable value is indexed again
+        """
+        user = User(email=5)
+        user.save()
+        user.email = "back@example.com"
+        user.save()
+        self.assertNotIn(user.id, base.UNINDEXED.get("User", {}))
+        self.assertEqual(User.search({"email__prefix": "back"}), [user])
+        self.assertEqual(User.search({"email": 5}), [])
+
+    def test_unhashable_value_saved(self):
+        """ A value the hash index can't hold is stored, and found
+        """
+        user = User(email=["a"])
+        other = User(email={"a": 1})
+        User.save_many([user, other])
+        self.assertEqual(User.count(), 7)
+        self.assertEqual(User.search({"email": ["a"]}), [user])
+        self.assertEqual(User.search({"email": {"a": 1}}), [other])
+        self.assertEqual(User.search({"email__in": [["a"]]}), [user])
+        self.assertEqual(len(User.search({"email__prefix": "user"})), 5)
+
+    def test_unhashable_value_reloaded(self):
+        """ The files hold the value as it was
+        """
+        User(email=["a"]).save()
+        User.flush()
+        User.load_from_file()
+        self.assertEqual(User.count(), 6)
+        self.assertEqual(len(User.search({"email": ["a"]})), 1)
+        self.assertEqual(len(User.search({"email": "user1@example.com"})),
+                         1)
+
+    @unittest.skipIf(base.COMPACT_MODELS, "compact timestamps are naive")
+    def test_aware_datetime(self):
+        """ A timestamp that can't be compared with the others is stored
+        """
+        user = User(email="aware@example.com")
+        user.created_at = datetime.now(timezone.utc)
+        user.save()
+        self.assertEqual(User.count(), 6)
+        self.assertEqual(
+            len(User.search({"created_at__gte": datetime(2000, 1, 1)})), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
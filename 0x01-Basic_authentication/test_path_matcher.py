@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Tests of api.v1.auth.path_matcher
+"""
+import itertools
+import re
+import time
+import unittest
+
+from api.v1.auth.path_matcher import PathMatcher
+
+
+def reference(patterns: list, path: str) -> bool:
+    """ Whether a pattern matches `path`, by regular expressions
+    """
+    if not path.endswith('/'):
+        path += '/'
+    for pattern in patterns:
+        if not pattern.endswith('/') and not pattern.endswith('*'):
+            pattern += '/'
+        regex = ".*".join(map(re.escape, pattern.split('*')))
+        if re.match(regex, path, re.DOTALL):
+            return True
+    return False
+
+
+class TestPathMatcher(unittest.TestCase):
+    """ PathMatcher
+    """
+
+    def test_exact(self):
+        """ A path matches itself, with or without a trailing '/'
+        """
+        matcher = PathMatcher(['/api/v1/status', '/api/v1/stats/'])
+        for path in ('/api/v1/status', '/api/v1/status/', '/api/v1/stats',
+                     '/api/v1/stats/'):
+            self.assertTrue(matcher.match(path), path)
+        for path in ('/api/v1/stat', '/api/v1/statuses', '/api/v1/',
+                     '/api/v1/users', ''):
+            self.assertFalse(matcher.match(path), path)
+
+    def test_prefix(self):
+        """ A path matches every path below it
+        """
+        matcher = PathMatcher(['/api/v1/status'])
+        self.assertTrue(matcher.match('/api/v1/status/deep/path'))
+        self.assertFalse(matcher.match('/api/v1/statusdeep/path'))
+
+    def test_wildcard(self):
+        """ A '*' matches any run of characters, even none
+        """
+        matcher = PathMatcher(['/api/v1/stat*', '/api/*/users/*/me'])
+        for path in ('/api/v1/stat', '/api/v1/status', '/api/v1/stats/x',
+                     '/api/v2/users/1/me', '/api/v1/users//me',
+                     '/api//users/a/b/me/c'):
+            self.assertTrue(matcher.match(path), path)
+        for path in ('/api/v1/sta', '/api/v2/users/1/you',
+                     '/api/v2/user/1/me'):
+            self.assertFalse(matcher.match(path), path)
+
+    def test_no_pattern(self):
+        """ Nothing matches an empty matcher
+        """
+        matcher = PathMatcher()
+        self.assertEqual(len(matcher), 0)
+        self.assertFalse(matcher.match('/'))
+
+    def test_many_stars(self):
+        """ Several '*' in a pattern don't backtrack
+        """
+        matcher = PathMatcher(['/*a*a*a*b'])
+        start = time.perf_counter()
+        self.assertFalse(matcher.match('/' + 'a' * 2000))
+        self.assertTrue(matcher.match('/' + 'a' * 2000 + 'b'))
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_reference(self):
+        """ Same answers as regular expressions on small alphabets
+        """
+        patterns = ['/a*b', '/*ab*a', '/b**', '/ab/', '/a*/*b/']
+        for size in range(6):
+            for chars in itertools.product('ab/*', repeat=size):
+                path = '/' + ''.join(chars)
+                for count in range(1, len(patterns) + 1):
+                    subset = patterns[:count]
+                    self.assertEqual(PathMatcher(subset).match(path),
+                                     reference(subset, path),
+                                     (subset, path))
+
+
+if __name__ == "__main__":
+    unittest.main()